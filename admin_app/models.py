@@ -17,7 +17,24 @@ class PaperWork(models.Model):
     assigned_at = models.DateTimeField(auto_now_add=True)
     deadline = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Last allocated version number, bumped atomically on every submission
+    latest_version_no = models.PositiveIntegerField(default=0)
+    # Maintained alongside the versions, see api.versionstats
+    version_count = models.PositiveIntegerField(default=0)
+    latest_submitted_at = models.DateTimeField(null=True, blank=True)
+    latest_ai_percent_self = models.FloatField(null=True, blank=True)
+    latest_ai_percent_verified = models.FloatField(null=True, blank=True)
+    # Versions to keep, VERSION_RETENTION_COUNT when unset
+    retention_count = models.PositiveIntegerField(null=True, blank=True)
     
     class Meta:
         verbose_name = 'Paper Work'
         verbose_name_plural = 'Paper Works'
+        indexes = [
+            # Researcher dashboards filter their own papers by status
+            models.Index(fields=['researcher', 'status'], name='paperwork_researcher_status'),
+            models.Index(fields=['status'], name='paperwork_status'),
+            # Report export and paperwork lists walk papers in (assigned_at, id) order
+            models.Index(fields=['assigned_at', 'id'], name='paperwork_assigned_at_id'),
+            models.Index(fields=['researcher', 'assigned_at', 'id'], name='paperwork_researcher_assigned'),
+        ]
@@ -1,15 +1,20 @@
 from rest_framework import serializers
 from .models import PaperWork
 from auth_app.serializers import UserSerializer
+from api.expansion import ExpandableSerializerMixin
 
-class PaperWorkSerializer(serializers.ModelSerializer):
+class PaperWorkSerializer(ExpandableSerializerMixin, serializers.ModelSerializer):
     researcher = UserSerializer(read_only=True)
     researcher_id = serializers.UUIDField(write_only=True)
+    expandable_fields = {'researcher': UserSerializer}
     
     class Meta:
         model = PaperWork
-        fields = ['id', 'title', 'researcher', 'researcher_id', 'status', 'assigned_at', 'deadline', 'updated_at']
-        read_only_fields = ['id', 'assigned_at', 'updated_at']
+        fields = ['id', 'title', 'researcher', 'researcher_id', 'status', 'assigned_at', 'deadline', 'updated_at',
+                  'retention_count', 'latest_version_no', 'version_count', 'latest_submitted_at',
+                  'latest_ai_percent_self', 'latest_ai_percent_verified']
+        read_only_fields = ['id', 'assigned_at', 'updated_at', 'latest_version_no', 'version_count',
+                            'latest_submitted_at', 'latest_ai_percent_self', 'latest_ai_percent_verified']
     
     def create(self, validated_data):
         return PaperWork.objects.create(**validated_data)
@@ -22,4 +27,12 @@ class PaperWorkStatusUpdateSerializer(serializers.ModelSerializer):
 class PaperWorkDeadlineUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaperWork
-        fields = ['deadline']
\ No newline at end of file
+        fields = ['deadline']
+    
+    def update(self, instance, validated_data):
+        # Save only the deadline so the version fields kept up to date by
+        # submissions and pruning are not overwritten with stale values
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
\ No newline at end of file
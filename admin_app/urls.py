@@ -10,6 +10,8 @@ urlpatterns = [
     path('paperworks/<uuid:id>/deadline/', views.update_paperwork_deadline, name='update_paperwork_deadline'),
     path('paperworks/<uuid:paperwork_id>/versions/<int:version_no>/<str:file_type>/view/', views.view_paperwork_file, name='view_paperwork_file'),
     path('paperworks/<uuid:paperwork_id>/versions/<int:version_no>/zip-contents/', views.view_zip_contents, name='view_zip_contents'),
+    path('paperworks/<uuid:paperwork_id>/versions/<int:version_no>/zip-tree/', views.view_zip_tree, name='view_zip_tree'),
     path('paperworks/<uuid:paperwork_id>/versions/<int:version_no>/zip-file/<path:file_path>/', views.view_zip_file_content, name='view_zip_file_content'),
+    path('paperworks/<uuid:paperwork_id>/versions/<int:version_no>/zip-raw/<path:file_path>/', views.view_zip_file_raw, name='view_zip_file_raw'),
     path("paperworks/<uuid:pk>/versions/<int:version_no>/<str:file_type>/download/", views.download_paperwork_file, name="download_paperwork_file")
 ]
\ No newline at end of file
@@ -5,44 +5,48 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.views.decorators.clickjacking import xframe_options_exempt
-from rest_framework_simplejwt.tokens import AccessToken
-from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
-from django.contrib.auth import get_user_model
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from auth_app.authentication import forget_user
 from auth_app.utils import IsAdmin
 from auth_app.models import User
 from .models import PaperWork
 from .serializers import PaperWorkSerializer, PaperWorkDeadlineUpdateSerializer
 from auth_app.serializers import UserRegistrationSerializer, UserSerializer
 from api.models import Version
+from api import blobstore, delivery, pagination, signedurls, statuscounts, storage, zipindex
+from api.replicas import replica_read
 from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+import logging
 import os
 import zipfile
-import base64
-from django.http import FileResponse, Http404, JsonResponse, HttpResponseNotFound
-
-def _auth_from_query_token(request):
-    token = getattr(request, "query_params", {}).get("token") or request.GET.get("token")
-    if not token:
-        return None
-    try:
-        decoded = AccessToken(token)
-        user_id = decoded.get("user_id")
-        if not user_id:
-            return None
-        User = get_user_model()
-        user = User.objects.get(id=user_id)
-        request.user = user
-        return user
-    except TokenError as e:
-        print(f"Token authentication error: {e}")
-        return None
-    except get_user_model().DoesNotExist:
-        return None
-    except Exception as e:
-        print(f"Unexpected token parse error: {e}")
-        return None
+from django.http import Http404, JsonResponse, HttpResponseNotFound
+
+logger = logging.getLogger(__name__)
+
+def _file_version(request, paperwork_id, version_no, file_type):
+    """
+    The version a file request may read and, for a signed URL, its expiry.
+
+    A URL signed for this file grants access without looking up the user or
+    the paperwork. Otherwise the request must be authenticated by header as
+    an admin or the paperwork's researcher. Raises NotAuthenticated,
+    PermissionDenied or Http404.
+    """
+    expires = signedurls.verify(request.GET, paperwork_id, version_no, file_type)
+    if expires is None and not (request.user and request.user.is_authenticated):
+        raise NotAuthenticated()
+
+    versions = Version.objects.filter(paperwork_id=paperwork_id, version_no=version_no)
+    if expires is None:
+        versions = versions.select_related('paperwork')
+    version = versions.first()
+    if version is None:
+        raise Http404("Version not found")
+    if expires is None and request.user.role != 'ADMIN' and version.paperwork.researcher_id != request.user.id:
+        raise PermissionDenied('Forbidden')
+    return version, expires
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsAdmin])
@@ -65,7 +69,7 @@ def update_paperwork_deadline(request, id):
     serializer = PaperWorkDeadlineUpdateSerializer(paperwork, data=request.data, partial=True)
     if serializer.is_valid():
         serializer.save()
-        return Response(PaperWorkSerializer(paperwork).data)
+        return Response(PaperWorkSerializer(paperwork, context={'request': request}).data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['PATCH'])
@@ -84,6 +88,8 @@ def update_user_status(request, username):
     
     user.status = status_value
     user.save()
+    # Frozen users must be refused on their next request, not when the cached snapshot expires
+    forget_user(user.id)
     
     return Response(UserSerializer(user).data)
 
@@ -99,91 +105,66 @@ def assign_paperwork(request):
         researcher = get_object_or_404(User, id=researcher_id, role='RESEARCHER')
         
         # Create the paperwork
-        paperwork = serializer.save(researcher=researcher)
+        with transaction.atomic():
+            paperwork = serializer.save(researcher=researcher)
+            statuscounts.record_transition(researcher.id, None, paperwork.status)
         
-        return Response(PaperWorkSerializer(paperwork).data, status=status.HTTP_201_CREATED)
+        return Response(PaperWorkSerializer(paperwork, context={'request': request}).data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_read
 def users_list(request):
     """Endpoint to list all users except admins in the system. Only accessible to admins."""
     users = User.objects.exclude(role='ADMIN')
+    try:
+        users, page = pagination.paginate(request, users, ('date_joined', 'id'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     serializer = UserSerializer(users, many=True)
-    return Response(serializer.data)
+    return Response({'results': serializer.data, **page})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])  # was IsAuthenticated
 @xframe_options_exempt            # allow rendering in <iframe>
+@replica_read
 def view_paperwork_file(request, paperwork_id, version_no, file_type):
-    # 1) Try auth from ?token=...
-    _auth_from_query_token(request)
-
-    # 2) If still unauthenticated, reject (works for either header or query-token)
-    if not request.user or not request.user.is_authenticated:
-        return Response({'detail': 'Authentication credentials were not provided.'},
-                        status=status.HTTP_401_UNAUTHORIZED)
-
-    # Existing lookup
-    try:
-        version = Version.objects.get(
-            paperwork__id=paperwork_id, version_no=version_no
-        )
-    except Version.DoesNotExist:
-        raise Http404("Version not found")
-
-    # 3) Object-level authorization: admin OR the assigned researcher
-    is_admin = getattr(request.user, 'role', '').upper() == 'ADMIN'
-    is_owner = getattr(version.paperwork, 'researcher_id', None) == getattr(request.user, 'id', None)
-    if not (is_admin or is_owner):
-        return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-
-    # ... keep your existing file path logic below unchanged ...
-    file_path = None
-    storage_path = None
-    if file_type == 'pdf':
-        file_path = version.pdf_path
-        storage_path = settings.PDF_STORAGE_PATH
-    elif file_type == 'tex':
-        file_path = version.latex_path
-        storage_path = settings.LATEX_STORAGE_PATH
-    elif file_type == 'zip':
-        file_path = version.python_path
-        storage_path = settings.PYTHON_STORAGE_PATH
-    elif file_type == 'docx':
-        file_path = version.docx_path
-        storage_path = settings.DOCX_STORAGE_PATH
-    else:
+    field_map = {
+        'pdf': 'pdf_path',
+        'tex': 'latex_path',
+        'zip': 'python_path',
+        'docx': 'docx_path',
+    }
+    field = field_map.get(file_type)
+    if not field:
         return Response({'error': 'Invalid file type'}, status=status.HTTP_400_BAD_REQUEST)
 
+    # Signed URL or header authentication as the admin or the assigned researcher
+    version, expires = _file_version(request, paperwork_id, version_no, file_type)
+    file_path = getattr(version, field)
+
     if not file_path:
         raise Http404(f"{file_type.capitalize()} file not found for this version")
 
-    filename = os.path.basename(file_path) if file_path else f"paper.{file_type}"
-    version_str = f"v{version_no}"
-
-    storage_full_path = os.path.join(
-        settings.MEDIA_ROOT, storage_path, str(paperwork_id), version_str, filename
-    )
+    filename = blobstore.download_name(file_path, field)
 
-    if os.path.exists(storage_full_path):
-        response = FileResponse(open(storage_full_path, 'rb'))
+    # Resolve the stored path on whichever media volume holds it
+    full_path = storage.locate(file_path)
+    if full_path:
         disposition = 'attachment' if request.GET.get('download') else 'inline'
-        response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
-        return response
-
-    direct_path = os.path.join(settings.MEDIA_ROOT, file_path)
-    if os.path.exists(direct_path):
-        response = FileResponse(open(direct_path, 'rb'))
-        disposition = 'attachment' if request.GET.get('download') else 'inline'
-        response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
-        return response
+        return delivery.file_response(
+            request, full_path, filename, disposition,
+            etag=delivery.file_etag(file_path, version, field), last_modified=version.submitted_at,
+            cache_control=signedurls.cache_control(expires) if expires else None
+        )
 
-    print(f"Attempted paths:\n1. {storage_full_path}\n2. {direct_path}")
+    logger.warning('File not found on any media volume: %s', file_path)
     raise Http404("File not found on server")
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_read
 def user_detail(request, user_id):
     """Endpoint to get a specific user by ID. Only accessible to admins."""
     from django.shortcuts import get_object_or_404
@@ -194,169 +175,200 @@ def user_detail(request, user_id):
 @api_view(['GET'])
 @permission_classes([AllowAny])  # was [IsAuthenticated, IsAdmin]
 @xframe_options_exempt            # allow rendering in <iframe>
+@replica_read
 def view_zip_contents(request, paperwork_id, version_no):
-    # 1) Try auth from ?token=
-    _auth_from_query_token(request)
+    # The admin or the researcher who owns this paperwork
+    version, _ = _file_version(request, paperwork_id, version_no, 'zip')
 
-    # 2) Require auth
-    if not request.user or not request.user.is_authenticated:
-        return Response({'detail': 'Authentication credentials were not provided.'},
-                        status=status.HTTP_401_UNAUTHORIZED)
+    if not version.python_path:
+        raise Http404("ZIP file not found")
+    zip_path = storage.locate(version.python_path)
 
-    # 3) If you want admin-only, keep this:
-    # is_admin = getattr(request.user, 'role', '').upper() == 'ADMIN'
-    # if not is_admin:
-    #     return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    if not zip_path:
+        raise Http404("ZIP file not found")
 
-    # OR: allow the researcher who owns this paperwork to view too
+    # Listing comes from the cached index, the archive itself is not opened
     try:
-        version = Version.objects.get(
-            paperwork__id=paperwork_id, version_no=version_no
-        )
-    except Version.DoesNotExist:
-        raise Http404("Version not found")
-
-    is_admin = getattr(request.user, 'role', '').upper() == 'ADMIN'
-    is_owner = getattr(version.paperwork, 'researcher_id', None) == getattr(request.user, 'id', None)
-    if not (is_admin or is_owner):
-        return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-
-    version_str = f"v{version_no}"
-    zip_path = os.path.join(
-        settings.MEDIA_ROOT,
-        settings.PYTHON_STORAGE_PATH,
-        str(paperwork_id),
-        version_str,
-        "code.zip"
-    )
-
-    if not os.path.exists(zip_path):
+        index = zipindex.load(version.python_path)
+    except zipfile.BadZipFile:
+        return Response({'error': 'File is not a zip file'}, status=status.HTTP_400_BAD_REQUEST)
+    if index is None:
         raise Http404("ZIP file not found")
 
-    contents = []
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        for name in z.namelist():
-            contents.append(name)
-
-    return JsonResponse({"files": contents})
+    return JsonResponse({"files": index.names})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 @xframe_options_exempt
-def view_zip_file_content(request, paperwork_id, version_no, file_path):
-    # 1) Try auth from ?token=...
-    _auth_from_query_token(request)
-
-    # 2) If still unauthenticated, reject
-    if not request.user or not request.user.is_authenticated:
-        return Response({'detail': 'Authentication credentials were not provided.'},
-                        status=status.HTTP_401_UNAUTHORIZED)
+@replica_read
+def view_zip_tree(request, paperwork_id, version_no):
+    """
+    One level (or ``depth`` levels) of the ZIP's directory tree below ``prefix``.
+
+    Query parameters: ``prefix``, ``depth`` (1-32), ``glob`` (matched against
+    file paths), ``cursor`` (``next_cursor`` of the previous page) and
+    ``limit`` (1-1000).
+    """
+    version, _ = _file_version(request, paperwork_id, version_no, 'zip')
+
+    prefix = request.GET.get('prefix', '').lstrip('/')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    try:
+        depth = int(request.GET.get('depth', 1))
+        limit = int(request.GET.get('limit', 200))
+        cursor = request.GET.get('cursor')
+        after = zipindex.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return Response({'error': 'depth and limit must be integers and cursor must come from a previous page'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= depth <= 32 or not 1 <= limit <= 1000:
+        return Response({'error': 'depth must be between 1 and 32 and limit between 1 and 1000'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    # Existing lookup
     try:
-        version = Version.objects.get(
-            paperwork__id=paperwork_id, version_no=version_no
-        )
-    except Version.DoesNotExist:
-        raise Http404("Version not found")
+        index = zipindex.load(version.python_path) if version.python_path else None
+    except zipfile.BadZipFile:
+        return Response({'error': 'File is not a zip file'}, status=status.HTTP_400_BAD_REQUEST)
+    if index is None:
+        raise Http404("ZIP file not found")
 
-    # 3) Object-level authorization: admin OR the assigned researcher
-    is_admin = getattr(request.user, 'role', '').upper() == 'ADMIN'
-    is_owner = getattr(version.paperwork, 'researcher_id', None) == getattr(request.user, 'id', None)
-    if not (is_admin or is_owner):
-        return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-
-    version_str = f"v{version_no}"
-    zip_path = os.path.join(
-        settings.MEDIA_ROOT,
-        settings.PYTHON_STORAGE_PATH,
-        str(paperwork_id),
-        version_str,
-        "code.zip"
+    entries, last_path = zipindex.list_tree(
+        index, prefix, depth, request.GET.get('glob') or None, after, limit
     )
+    if entries is None:
+        return Response({'error': 'Directory not found in ZIP archive'}, status=status.HTTP_404_NOT_FOUND)
+
+    root = index.dirs[prefix]
+    return Response({
+        'prefix': prefix,
+        'file_count': root.file_count,
+        'dir_count': root.dir_count,
+        'size': root.size,
+        'compressed_size': root.compress_size,
+        'entries': entries,
+        'next_cursor': zipindex.encode_cursor(last_path) if last_path else None,
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@xframe_options_exempt
+@replica_read
+def view_zip_file_content(request, paperwork_id, version_no, file_path):
+    # Signed URL or header authentication as the admin or the assigned researcher
+    version, expires = _file_version(request, paperwork_id, version_no, 'zip')
+
+    if not version.python_path:
+        raise Http404("ZIP file not found")
+    zip_path = storage.locate(version.python_path)
 
-    if not os.path.exists(zip_path):
+    if not zip_path:
         raise Http404("ZIP file not found")
 
     try:
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            # Check if the file exists in the ZIP
-            if file_path not in z.namelist():
-                return Response({'error': 'File not found in ZIP archive'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Determine content type based on file extension
-            file_extension = file_path.split('.')[-1].lower() if '.' in file_path else ''
-            content_type = 'text/plain'
-            is_binary = False
-            
-            # Text-based files
-            if file_extension in ['py']:
-                content_type = 'text/x-python'
-            elif file_extension in ['ipynb']:
-                content_type = 'application/json'
-            # Image files
-            elif file_extension in ['png']:
-                content_type = 'image/png'
-                is_binary = True
-            elif file_extension in ['jpg', 'jpeg']:
-                content_type = 'image/jpeg'
-                is_binary = True
-            
-            # Handle binary files (images)
-            if is_binary:
-                file_content = base64.b64encode(z.read(file_path)).decode('utf-8')
-                return Response({
-                    'content': file_content, 
-                    'content_type': content_type,
-                    'is_binary': True
-                })
-            else:
-                # Handle text files
-                file_content = z.read(file_path).decode('utf-8', errors='replace')
-                return Response({
-                    'content': file_content, 
-                    'content_type': content_type,
-                    'is_binary': False
-                })
+        index = zipindex.load(version.python_path)
+        entry = index.get(file_path) if index else None
+        # Check if the file exists in the ZIP
+        if entry is None:
+            return Response({'error': 'File not found in ZIP archive'}, status=status.HTTP_404_NOT_FOUND)
+
+        content_type = zipindex.member_content_type(file_path)
+        is_binary = not zipindex.is_text(content_type)
+
+        # Only small text files are inlined; binary and large files are
+        # fetched from the raw endpoint, which streams them
+        if is_binary or entry.file_size > settings.ZIP_MEMBER_JSON_MAX_BYTES:
+            return Response({
+                'content': None,
+                'content_type': content_type,
+                'is_binary': is_binary,
+                'size': entry.file_size,
+                # Same signature: every member of the ZIP shares the 'zip' scope
+                'url': reverse('view_zip_file_raw', args=[paperwork_id, version_no, file_path])
+                       + (f'?{signedurls.query_string(request.GET)}' if expires else ''),
+            })
+
+        file_content = zipindex.read_member(zip_path, entry).decode('utf-8', errors='replace')
+        return Response({
+            'content': file_content, 
+            'content_type': content_type,
+            'is_binary': False
+        })
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@xframe_options_exempt
+@replica_read
+def view_zip_file_raw(request, paperwork_id, version_no, file_path):
+    """Streams a single ZIP member with its own content type, supporting Range requests."""
+    version, expires = _file_version(request, paperwork_id, version_no, 'zip')
+
+    zip_path = storage.locate(version.python_path) if version.python_path else None
+    if not zip_path:
+        raise Http404("ZIP file not found")
+
+    try:
+        index = zipindex.load(version.python_path)
+    except zipfile.BadZipFile:
+        return Response({'error': 'File is not a zip file'}, status=status.HTTP_400_BAD_REQUEST)
+    entry = index.get(file_path) if index else None
+    if entry is None or file_path.endswith('/'):
+        return Response({'error': 'File not found in ZIP archive'}, status=status.HTTP_404_NOT_FOUND)
+    if entry.file_size > settings.ZIP_MEMBER_MAX_BYTES:
+        return Response({'error': f'File is larger than {settings.ZIP_MEMBER_MAX_BYTES} bytes'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    content_type = zipindex.member_content_type(file_path)
+    if zipindex.is_text(content_type):
+        content_type += '; charset=utf-8'
+    response = delivery.stream_response(
+        request,
+        lambda start, count: zipindex.read_member_range(zip_path, entry, start, count),
+        entry.file_size,
+        os.path.basename(file_path),
+        'attachment' if request.GET.get('download') else 'inline',
+        content_type=content_type,
+        etag=zipindex.member_etag(delivery.file_etag(version.python_path, version, 'python_path'), entry),
+        last_modified=version.submitted_at,
+        cache_control=signedurls.cache_control(expires) if expires else None,
+    )
+    # Members are untrusted uploads: never sniff, and never run scripts on our origin
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    return response
+
+@replica_read
 def download_paperwork_file(request, pk, version_no, file_type):
-    # Try token auth first
-    token = request.GET.get("token")
-    if token:
-        jwt_auth = JWTAuthentication()
-        try:
-            validated_token = jwt_auth.get_validated_token(token)
-            user = jwt_auth.get_user(validated_token)
-            request.user = user
-        except Exception:
-            raise AuthenticationFailed("Invalid token")
-
-    if not request.user or not request.user.is_authenticated:
-        return Response({"detail": "Authentication credentials were not provided."}, status=401)
-
-    paperwork = get_object_or_404(PaperWork, pk=pk)
-    version = get_object_or_404(paperwork.versions, version_no=version_no)
+    # A plain Django view: only signed URLs (or a session) authenticate here
+    try:
+        version, expires = _file_version(request, pk, version_no, file_type)
+    except (NotAuthenticated, PermissionDenied) as e:
+        return JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+
     # Map file_type string to the correct model field
-    path_map = {
-        "pdf": getattr(version, "pdf_path", None),
-        "docx": getattr(version, "docx_path", None),
-        "tex": getattr(version, "latex_path", None),
-        "python": getattr(version, "python_path", None),
-        "zip": getattr(version, "zip_path", None),
+    field_map = {
+        "pdf": "pdf_path",
+        "docx": "docx_path",
+        "tex": "latex_path",
+        "python": "python_path",
+        "zip": "python_path",
     }
 
-    rel_path = path_map.get(file_type)
+    field = field_map.get(file_type)
+    rel_path = getattr(version, field, None) if field else None
     if not rel_path:
         return HttpResponseNotFound(f"Unsupported file type: {file_type}")
 
-    # Build absolute path
-    file_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    # Resolve the stored path on whichever media volume holds it
+    file_path = storage.locate(rel_path)
 
-    if not os.path.exists(file_path):
+    if not file_path:
         return HttpResponseNotFound("File not found on disk")
 
-    response = FileResponse(open(file_path, "rb"), content_type="application/octet-stream")
-    response["Content-Disposition"] = f"attachment; filename={os.path.basename(file_path)}"
-    return response
\ No newline at end of file
+    return delivery.file_response(request, file_path, blobstore.download_name(rel_path, field), "attachment",
+                                  content_type="application/octet-stream",
+                                  etag=delivery.file_etag(rel_path, version, field),
+                                  last_modified=version.submitted_at,
+                                  cache_control=signedurls.cache_control(expires) if expires else None)
\ No newline at end of file
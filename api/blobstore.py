@@ -0,0 +1,235 @@
+"""
+Content-addressed storage for version files.
+
+Every file is stored once under ``BLOB_STORAGE_PATH/<aa>/<bb>/<sha256>`` on
+one of the media volumes and Version rows point at that path. ``Blob.ref_count`` tracks how many Version
+path fields reference a blob; the file is removed when it drops to zero.
+Paths that are not blob paths (files written before the blob store existed)
+are owned by a single version and are deleted directly.
+
+Reference changes are made inside the caller's transaction while the files
+themselves are only moved into place or unlinked once that transaction
+commits, so a rolled back submission never leaves anything behind.
+
+Publishing, unlinking and moving a blob file happen under ``blob_lock``, an
+flock on one of 256 lock files per hash prefix under
+``BLOB_STORAGE_PATH/locks`` on the first volume. That serializes them across
+threads, uvicorn workers and management commands alike, so an unlink that
+found no Blob row cannot delete a file a concurrent submission has just
+published.
+"""
+import fcntl
+import hashlib
+import os
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Blob
+from . import storage, zipindex
+
+CHUNK_SIZE = 64 * 1024
+
+# Version path field -> file name presented to clients
+FILE_NAMES = {
+    'pdf_path': 'paper.pdf',
+    'latex_path': 'latex.tex',
+    'python_path': 'code.zip',
+    'docx_path': 'paper.docx',
+}
+PATH_FIELDS = tuple(FILE_NAMES)
+
+@dataclass
+class StagedFile:
+    path: str
+    sha256: str
+    size: int
+
+def blob_path(sha256):
+    return f"{settings.BLOB_STORAGE_PATH}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def is_blob_path(rel_path):
+    return bool(rel_path) and rel_path.startswith(f"{settings.BLOB_STORAGE_PATH}/")
+
+def download_name(rel_path, field):
+    """File name to present for ``rel_path`` stored in Version field ``field``."""
+    if is_blob_path(rel_path):
+        return FILE_NAMES[field]
+    return os.path.basename(rel_path)
+
+def staging_folder(volume=None):
+    return storage.path_on(volume or storage.volumes()[0], os.path.join(settings.BLOB_STORAGE_PATH, 'tmp'))
+
+def lock_folder():
+    return storage.path_on(storage.volumes()[0], os.path.join(settings.BLOB_STORAGE_PATH, 'locks'))
+
+@contextmanager
+def blob_lock(hashes):
+    """
+    Hold the cross-process locks of the blobs ``hashes`` while the block runs.
+
+    The locks are per hash prefix and taken in order, so callers locking
+    several blobs cannot deadlock each other.
+    """
+    os.makedirs(lock_folder(), exist_ok=True)
+    with ExitStack() as stack:
+        for prefix in sorted({sha256[:2] for sha256 in hashes}):
+            lock_file = stack.enter_context(open(os.path.join(lock_folder(), prefix), 'a'))
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def stage_chunks(chunks, volume=None):
+    """
+    Write an iterable of byte chunks to a staging file, hashing while writing.
+
+    The file is staged on ``volume`` and published to the same volume.
+    """
+    os.makedirs(staging_folder(volume), exist_ok=True)
+    staged = StagedFile(os.path.join(staging_folder(volume), uuid.uuid4().hex), '', 0)
+
+    digest = hashlib.sha256()
+    try:
+        with open(staged.path, 'wb') as destination:
+            for chunk in chunks:
+                digest.update(chunk)
+                destination.write(chunk)
+                staged.size += len(chunk)
+    except Exception:
+        discard(staged)
+        raise
+    staged.sha256 = digest.hexdigest()
+    return staged
+
+def discard(staged):
+    """Remove a staging file that was not published."""
+    if os.path.exists(staged.path):
+        os.remove(staged.path)
+
+def add_reference(staged):
+    """
+    Reference the content of ``staged`` from a Version path field.
+
+    Must run inside a transaction. The staging file is moved into the blob
+    store when the transaction commits. Returns the volume independent blob
+    path.
+    """
+    sha256 = staged.sha256
+    if not Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+        try:
+            with transaction.atomic():
+                Blob.objects.create(sha256=sha256, size=staged.size, ref_count=1)
+        except IntegrityError:
+            # Created concurrently by another submission
+            Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+
+    rel_path = blob_path(sha256)
+    transaction.on_commit(lambda: _publish(staged, rel_path))
+    return rel_path
+
+def _publish(staged, rel_path):
+    volume = storage.volume_of(staged.path)
+    target = storage.path_on(volume, rel_path)
+    with blob_lock([staged.sha256]):
+        if not os.path.exists(staged.path):
+            return
+        existing = storage.locate(rel_path)
+        if existing and existing != target:
+            # Already stored on another volume
+            os.remove(staged.path)
+            return
+        # Same content either way, replacing keeps the file if an unlink raced us
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(staged.path, target)
+
+def move(sha256, volume):
+    """
+    Move the blob ``sha256`` onto ``volume`` unless it is no longer
+    referenced. Returns whether it was moved.
+    """
+    with blob_lock([sha256]):
+        # Pruned meanwhile, the file is about to be unlinked
+        if not Blob.objects.filter(sha256=sha256).exists():
+            return False
+        return storage.move(blob_path(sha256), volume)
+
+def remove_interrupted_move(full_path):
+    """Delete the partial copy left by a move that was interrupted."""
+    sha256 = os.path.basename(full_path).removesuffix(storage.MOVING_SUFFIX)
+    # Moves hold the lock, so a copy found under it is not being written
+    with blob_lock([sha256]):
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+
+def release(rel_paths):
+    """
+    Drop one reference for each path.
+
+    Must run inside a transaction; files nobody references any more are
+    deleted once it commits.
+    """
+    removable = release_references(rel_paths)
+    if removable:
+        transaction.on_commit(lambda: unlink_files(removable))
+
+def release_references(rel_paths):
+    """
+    Drop one reference for each path with a handful of statements.
+
+    Must run inside a transaction. Returns the paths that can be unlinked
+    with ``unlink_files`` after it commits.
+    """
+    removable = []
+    counts = Counter()
+    for rel_path in rel_paths:
+        if not rel_path:
+            continue
+        if is_blob_path(rel_path):
+            counts[os.path.basename(rel_path)] += 1
+        else:
+            removable.append(rel_path)
+    if not counts:
+        return removable
+
+    # One UPDATE per distinct number of released references
+    by_count = defaultdict(list)
+    for sha256, count in counts.items():
+        by_count[count].append(sha256)
+    for count, hashes in by_count.items():
+        Blob.objects.filter(sha256__in=hashes).update(ref_count=Greatest(F('ref_count') - count, 0))
+
+    unreferenced = list(
+        Blob.objects.filter(sha256__in=list(counts), ref_count=0).values_list('sha256', flat=True)
+    )
+    Blob.objects.filter(sha256__in=unreferenced, ref_count=0).delete()
+    removable.extend(blob_path(sha256) for sha256 in unreferenced)
+    return removable
+
+def unlink_files(rel_paths, workers=1):
+    """Delete released files, using ``workers`` threads for large batches."""
+    hashes = [os.path.basename(path) for path in rel_paths if is_blob_path(path)]
+    with blob_lock(hashes):
+        # A submission may have referenced the same content again meanwhile
+        revived = set(Blob.objects.filter(sha256__in=hashes).values_list('sha256', flat=True)) if hashes else set()
+        rel_paths = [path for path in rel_paths if os.path.basename(path) not in revived]
+
+        if workers > 1 and len(rel_paths) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(_unlink, rel_paths))
+        else:
+            for rel_path in rel_paths:
+                _unlink(rel_path)
+
+def _unlink(rel_path):
+    storage.remove(rel_path)
+    zipindex.forget(rel_path)
+
+def version_paths(version):
+    return [getattr(version, field) for field in PATH_FIELDS]
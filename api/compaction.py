@@ -0,0 +1,73 @@
+"""
+Notification retention.
+
+Notifications older than NOTIFICATION_RETENTION_DAYS are folded into
+NotificationSummary rows, one per paper, month and event with the count and
+the first and last time, and deleted together with their inbox items. That
+keeps the notification and inbox tables down to recent events. ``manage.py
+compact_notifications`` runs it in batches, one short transaction each, so
+it can run from cron next to the live application.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Count, DateField, F, Max, Min, Value
+from django.db.models.functions import Greatest, Least, TruncMonth
+from django.utils import timezone
+
+from .models import InboxItem, Notification, NotificationSummary
+from . import inbox
+
+def _add(paper_id, month, event, count, first_at, last_at):
+    rows = NotificationSummary.objects.filter(paper_id=paper_id, month=month, event=event)
+    changes = {
+        'count': F('count') + count,
+        'first_at': Least(F('first_at'), Value(first_at)),
+        'last_at': Greatest(F('last_at'), Value(last_at)),
+    }
+    if not rows.update(**changes):
+        try:
+            with transaction.atomic():
+                NotificationSummary.objects.create(paper_id=paper_id, month=month, event=event, count=count,
+                                                   first_at=first_at, last_at=last_at)
+        except IntegrityError:
+            # Created concurrently by another compaction
+            rows.update(**changes)
+
+def compact_batch(ids):
+    """
+    Summarize and delete the notifications with ``ids``. Rows another
+    compaction removed meanwhile are skipped. Returns how many were compacted.
+    """
+    with transaction.atomic():
+        ids = list(Notification.objects.filter(id__in=ids).select_for_update().values_list('id', flat=True))
+        batch = Notification.objects.filter(id__in=ids)
+        groups = (batch.order_by()
+                  .annotate(month=TruncMonth('at', output_field=DateField()))
+                  .values_list('paper_id', 'month', 'event')
+                  .annotate(count=Count('pk'), first_at=Min('at'), last_at=Max('at')))
+        for group in groups:
+            _add(*group)
+        inbox.release(InboxItem.objects.filter(notification_id__in=ids))
+        batch.delete()
+    return len(ids)
+
+def compact(days=None, batch_size=1000, max_batches=None):
+    """
+    Compact every notification older than ``days`` (NOTIFICATION_RETENTION_DAYS
+    by default), oldest first. Stops after ``max_batches`` batches when
+    given. Returns the number of notifications compacted.
+    """
+    days = settings.NOTIFICATION_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    old = Notification.objects.filter(at__lt=cutoff).order_by('at', 'id').values_list('id', flat=True)
+
+    compacted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(old[:batch_size])
+        if not ids:
+            break
+        compacted += compact_batch(ids)
+        batches += 1
+    return compacted
@@ -0,0 +1,383 @@
+"""
+File delivery for the paperwork file views.
+
+``FILE_DELIVERY_MODE`` selects who sends the bytes once a view has checked
+authentication and ownership:
+
+- ``python``: Django streams the file itself (the default)
+- ``x-accel``: nginx, via ``X-Accel-Redirect`` to an internal location
+- ``x-sendfile``: Apache/lighttpd, via ``X-Sendfile``
+- ``asgi``: ``SendfileMiddleware`` in front of the ASGI application, so the
+  Django worker is released as soon as the view returns
+
+Responses carry a strong ``ETag`` and ``Last-Modified`` so browsers can
+revalidate with a 304, and byte ranges (including multipart ranges) are
+answered with 206. Version files never change once submitted, which is what
+makes the validators strong.
+"""
+import mimetypes
+import os
+import uuid
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from . import blobstore, storage
+
+# Internal headers telling SendfileMiddleware which file (and byte range) to send; never sent to clients
+SENDFILE_HEADER = 'X-PMS-Sendfile'
+SENDFILE_RANGE_HEADER = 'X-PMS-Sendfile-Range'
+SENDFILE_CHUNK_SIZE = 1024 * 1024
+
+# Requests asking for more ranges than this are answered with the whole file
+MAX_RANGES = 64
+
+def content_type_for(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def accel_uri(full_path):
+    """Internal nginx location of ``full_path``: ``<prefix>/<volume index>/<path>``."""
+    volume = storage.volume_of(full_path)
+    rel_path = os.path.relpath(full_path, volume)
+    prefix = settings.FILE_DELIVERY_ACCEL_PREFIX.rstrip('/')
+    return f"{prefix}/{storage.volumes().index(volume)}/{quote(rel_path)}"
+
+def file_etag(rel_path, version, field):
+    """
+    Strong ETag of a version file.
+
+    Blob paths are named after the content hash; legacy files belong to a
+    single version field and are never rewritten.
+    """
+    if blobstore.is_blob_path(rel_path):
+        return f'"{os.path.basename(rel_path)}"'
+    return f'"{version.id.hex}-{field}"'
+
+def parse_range(header, size):
+    """
+    Parse a ``Range`` header against a file of ``size`` bytes.
+
+    Returns a sorted list of ``(start, end)`` tuples with inclusive ends and
+    overlapping or adjacent ranges merged, ``[]`` if no range is satisfiable,
+    or None if the header should be ignored (missing, malformed or too many
+    ranges).
+    """
+    if not header or '=' not in header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, dash, last = spec.partition('-')
+        if not dash:
+            return None
+        first, last = first.strip(), last.strip()
+        if (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _if_range_passes(request, etag, last_modified):
+    """Whether a ``Range`` header may be honoured given the request's ``If-Range``."""
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Strong comparison: weak validators never match
+        return etag is not None and not if_range.startswith('W/') and if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and date == last_modified
+
+def _read_chunks(path, start, count):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while count > 0:
+            chunk = file.read(min(SENDFILE_CHUNK_SIZE, count))
+            if not chunk:
+                break
+            count -= len(chunk)
+            yield chunk
+
+def streaming_content(request, chunks, thread_sensitive=False):
+    """
+    Body for a StreamingHttpResponse.
+
+    Under ASGI Django would read a sync iterator into memory before sending
+    it, so there the chunks are pulled one at a time off the event loop.
+    Iterators that query the database must pass ``thread_sensitive=True``
+    so every chunk runs on the request's own thread and connection.
+    """
+    if not isinstance(getattr(request, '_request', request), ASGIRequest):
+        return chunks
+
+    async def pull():
+        next_chunk = sync_to_async(next, thread_sensitive=thread_sensitive)
+        iterator = iter(chunks)
+        while (chunk := await next_chunk(iterator, None)) is not None:
+            yield chunk
+    return pull()
+
+def _validators(etag, last_modified, cache_control=None):
+    validators = {'Cache-Control': cache_control or 'private, no-cache'}
+    if etag:
+        validators['ETag'] = etag
+    if last_modified is not None:
+        validators['Last-Modified'] = http_date(last_modified)
+    return validators
+
+def _requested_ranges(request, size, etag, last_modified):
+    if request.method not in ('GET', 'HEAD') or not _if_range_passes(request, etag, last_modified):
+        return None
+    return parse_range(request.META.get('HTTP_RANGE'), size)
+
+def _range_not_satisfiable(size, content_type):
+    response = HttpResponse(status=416, content_type=content_type)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+def _multipart_response(request, ranges, size, content_type, read):
+    """206 response with one ``multipart/byteranges`` part per range; only the requested bytes are read."""
+    boundary = uuid.uuid4().hex
+    parts = [
+        (f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+         f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n".encode('latin-1'), start, end)
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode('latin-1')
+
+    def body():
+        for part_header, start, end in parts:
+            yield part_header
+            yield from read(start, end - start + 1)
+        yield closing
+
+    length = sum(len(part_header) + end - start + 1 for part_header, start, end in parts) + len(closing)
+    response = StreamingHttpResponse(
+        streaming_content(request, body()), status=206,
+        content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+    response['Content-Length'] = str(length)
+    return response
+
+def _conditional_response(request, etag, last_modified, cache_control=None):
+    """304/412 response for a conditional request, or None to send the content."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        for name, value in _validators(etag, last_modified, cache_control).items():
+            response[name] = value
+    return response
+
+def _finish(response, filename, disposition, etag, last_modified, cache_control=None):
+    for name, value in _validators(etag, last_modified, cache_control).items():
+        response[name] = value
+    response['Accept-Ranges'] = 'bytes'
+    if response.status_code != 416:
+        response['Content-Disposition'] = content_disposition_header(disposition == 'attachment', filename)
+    return response
+
+def file_response(request, full_path, filename, disposition='inline', content_type=None,
+                  etag=None, last_modified=None, cache_control=None):
+    """
+    Response delivering ``full_path`` according to FILE_DELIVERY_MODE.
+
+    ``etag`` and ``last_modified`` (a datetime) are used to answer
+    conditional requests with 304/412 and to validate ``If-Range``. In the
+    proxy modes the proxy serves byte ranges itself; otherwise ``Range``
+    requests get a 206, with a ``multipart/byteranges`` body when several
+    ranges are asked for. ``cache_control`` replaces the default
+    ``private, no-cache``.
+    """
+    content_type = content_type or content_type_for(filename)
+    mode = settings.FILE_DELIVERY_MODE
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    conditional = _conditional_response(request, etag, last_modified, cache_control)
+    if conditional is not None:
+        return conditional
+
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_uri(full_path)
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = _local_response(request, full_path, content_type, mode, etag, last_modified)
+    return _finish(response, filename, disposition, etag, last_modified, cache_control)
+
+def _local_response(request, full_path, content_type, mode, etag, last_modified):
+    """Full or partial response for a file sent by this application."""
+    size = os.path.getsize(full_path)
+    ranges = _requested_ranges(request, size, etag, last_modified)
+
+    if ranges == []:
+        return _range_not_satisfiable(size, content_type)
+
+    if ranges is None:
+        if mode == 'asgi':
+            response = HttpResponse(content_type=content_type)
+            response[SENDFILE_HEADER] = full_path
+            response['Content-Length'] = str(size)
+            return response
+        return FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        if mode == 'asgi':
+            response = HttpResponse(status=206, content_type=content_type)
+            response[SENDFILE_HEADER] = full_path
+            response[SENDFILE_RANGE_HEADER] = f'{start}-{end}'
+        else:
+            response = StreamingHttpResponse(
+                streaming_content(request, _read_chunks(full_path, start, end - start + 1)),
+                status=206, content_type=content_type
+            )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    # Several ranges: the part headers are interleaved with file data, so
+    # this is always streamed by Django
+    return _multipart_response(request, ranges, size, content_type,
+                               lambda start, count: _read_chunks(full_path, start, count))
+
+def stream_response(request, read, size, filename, disposition='inline', content_type=None,
+                    etag=None, last_modified=None, cache_control=None):
+    """
+    Response streaming content that is not a plain file, such as a ZIP member.
+
+    ``read(start, count)`` yields the bytes of that span. Conditional
+    requests, byte ranges and ``cache_control`` are handled as in
+    ``file_response``.
+    """
+    content_type = content_type or content_type_for(filename)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    conditional = _conditional_response(request, etag, last_modified, cache_control)
+    if conditional is not None:
+        return conditional
+
+    ranges = _requested_ranges(request, size, etag, last_modified)
+    if ranges == []:
+        response = _range_not_satisfiable(size, content_type)
+    elif ranges is not None and len(ranges) > 1:
+        response = _multipart_response(request, ranges, size, content_type, read)
+    else:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        response = StreamingHttpResponse(
+            streaming_content(request, read(start, end - start + 1)),
+            status=206 if ranges else 200, content_type=content_type
+        )
+        if ranges:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    return _finish(response, filename, disposition, etag, last_modified, cache_control)
+
+class SendfileMiddleware:
+    """
+    ASGI middleware sending files for responses marked with SENDFILE_HEADER.
+
+    Servers implementing the ``http.response.zerocopysend`` extension get the
+    open file and send it with ``os.sendfile``; otherwise the file is read in
+    large chunks off the event loop. Either way no Django worker thread is
+    held for the transfer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        header = SENDFILE_HEADER.lower().encode()
+        range_header = SENDFILE_RANGE_HEADER.lower().encode()
+        sendfile_path = None
+        offset, count = 0, None
+
+        async def send_wrapper(message):
+            nonlocal sendfile_path, offset, count
+            if message['type'] == 'http.response.start':
+                headers = []
+                for name, value in message.get('headers', []):
+                    if name.lower() == header:
+                        sendfile_path = value.decode('latin-1')
+                    elif name.lower() == range_header:
+                        start, _, end = value.decode('latin-1').partition('-')
+                        offset, count = int(start), int(end) - int(start) + 1
+                    else:
+                        headers.append((name, value))
+                message = dict(message, headers=headers)
+            elif message['type'] == 'http.response.body' and sendfile_path is not None:
+                # Swallow the empty body of the marked response and send the file instead
+                if message.get('more_body', False):
+                    return
+                if scope.get('method') == 'HEAD':
+                    return await send(message)
+                return await send_file(scope, send, sendfile_path, offset, count)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+async def send_file(scope, send, path, offset=0, count=None):
+    """Send ``count`` bytes of ``path`` from ``offset`` as the rest of the response body."""
+    if count is None:
+        count = os.path.getsize(path) - offset
+
+    file = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        if 'http.response.zerocopysend' in scope.get('extensions', {}):
+            await send({
+                'type': 'http.response.zerocopysend',
+                'file': file,
+                'offset': offset,
+                'count': count,
+                'more_body': False,
+            })
+            return
+
+        read = sync_to_async(os.pread, thread_sensitive=False)
+        remaining = count
+        position = offset
+        while remaining > 0:
+            chunk = await read(file.fileno(), min(SENDFILE_CHUNK_SIZE, remaining), position)
+            if not chunk:
+                break
+            position += len(chunk)
+            remaining -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        if remaining > 0 or count == 0:
+            # Empty file, or it shrank underneath us: end the body
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        file.close()
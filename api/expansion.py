@@ -0,0 +1,72 @@
+"""
+Sparse fieldsets and expansion of nested objects.
+
+Serializers using ``ExpandableSerializerMixin`` render related objects as
+their id unless the ``expand`` query parameter names them, e.g.
+``?expand=paper`` or ``?expand=paper.researcher`` for nested levels.
+``?fields=id,event,paper`` limits the top-level fields returned. The
+matching ``select_related`` is applied by ``expand_queryset``, so expanded
+lists still take one query.
+"""
+from rest_framework import serializers
+
+def _split(value):
+    return [item for item in (value or '').split(',') if item]
+
+def _nested(expand, name):
+    """Expansions below ``name`` in a list of dotted paths."""
+    return [path.split('.', 1)[1] for path in expand if path.startswith(f'{name}.')]
+
+def _expanded(expand, name):
+    return any(path == name or path.startswith(f'{name}.') for path in expand)
+
+def requested(request, param):
+    """Comma separated values of a query parameter."""
+    return _split(getattr(request, 'query_params', {}).get(param))
+
+class ExpandableSerializerMixin:
+    """
+    ``expandable_fields`` maps a foreign key name to the serializer used when
+    it is expanded; otherwise the field is rendered from ``<name>_id`` without
+    loading the related object.
+
+    The top-level serializer reads ``expand`` and ``fields`` from the request
+    in its context; nested serializers get their part of ``expand`` passed in.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            request = self.context.get('request')
+            expand = requested(request, 'expand')
+            fields = fields or requested(request, 'fields')
+
+        for name, serializer_class in self.expandable_fields.items():
+            if name not in self.fields:
+                continue
+            if _expanded(expand, name):
+                nested = {'expand': _nested(expand, name)} if issubclass(serializer_class, ExpandableSerializerMixin) else {}
+                self.fields[name] = serializer_class(read_only=True, **nested)
+            else:
+                self.fields[name] = serializers.ReadOnlyField(source=f'{name}_id')
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def related_paths(cls, expand, prefix=''):
+        """``select_related`` paths for the expansions in ``expand``."""
+        paths = []
+        for name, serializer_class in cls.expandable_fields.items():
+            if _expanded(expand, name):
+                paths.append(prefix + name)
+                if issubclass(serializer_class, ExpandableSerializerMixin):
+                    paths.extend(serializer_class.related_paths(_nested(expand, name), f'{prefix}{name}__'))
+        return paths
+
+def expand_queryset(queryset, serializer_class, request):
+    """``queryset`` with the related objects the request expands joined in."""
+    paths = serializer_class.related_paths(requested(request, 'expand'))
+    return queryset.select_related(*paths) if paths else queryset
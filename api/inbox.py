@@ -0,0 +1,130 @@
+"""
+Per-recipient notification inboxes.
+
+Every Notification is fanned out to one InboxItem per recipient, the
+paper's researcher and every admin, in the transaction that creates it.
+The items carry a copy of the event, paper and time, so a user's feed is a
+range scan of their own rows instead of a join through the paperworks, and
+a read flag.
+
+UnreadCount holds each user's number of unread items. Delivering, marking
+read and deleting items adjust it in the same transaction, so
+``unread_count`` is a primary key lookup. ``manage.py rebuild_inbox``
+recomputes the counts from the items.
+"""
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from auth_app.models import User
+from .models import InboxItem, Notification, UnreadCount
+from . import streams
+
+def _recipients(researcher_id, admin_ids):
+    return {researcher_id, *admin_ids}
+
+def _adjust(deltas):
+    """Add ``{recipient_id: delta}`` to the unread counts, creating missing rows."""
+    by_delta = defaultdict(list)
+    for recipient_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(recipient_id)
+
+    # Usually every recipient changes by the same amount, one update covers them
+    for delta, recipient_ids in by_delta.items():
+        rows = UnreadCount.objects.filter(recipient_id__in=recipient_ids)
+        if rows.update(count=F('count') + delta) == len(recipient_ids):
+            continue
+        existing = set(rows.values_list('recipient_id', flat=True))
+        missing = [recipient_id for recipient_id in recipient_ids if recipient_id not in existing]
+        # Rows created concurrently are kept and adjusted like the others
+        UnreadCount.objects.bulk_create([UnreadCount(recipient_id=recipient_id) for recipient_id in missing],
+                                        ignore_conflicts=True)
+        UnreadCount.objects.filter(recipient_id__in=missing).update(count=F('count') + delta)
+
+def deliver(notifications, admin_ids=None):
+    """
+    Put ``notifications`` into their recipients' inboxes as unread.
+
+    Call it in the transaction that creates them; the items are pushed to
+    open notification streams once it commits. ``admin_ids`` replaces the
+    admins notified, every admin by default. Returns the items.
+    """
+    if admin_ids is None:
+        admin_ids = list(User.objects.filter(role='ADMIN').values_list('id', flat=True))
+    items = [
+        InboxItem(recipient_id=recipient_id, notification=notification, event=notification.event,
+                  paper_id=notification.paper_id, at=notification.at)
+        for notification in notifications
+        for recipient_id in _recipients(notification.paper.researcher_id, admin_ids)
+    ]
+    InboxItem.objects.bulk_create(items)
+    _adjust(Counter(item.recipient_id for item in items))
+    transaction.on_commit(lambda: streams.publish(items))
+    return items
+
+def mark_read(user, ids=None):
+    """Mark ``user``'s items with ``ids``, or all of them, as read. Returns how many were unread."""
+    with transaction.atomic():
+        items = InboxItem.objects.filter(recipient=user, read=False)
+        if ids is not None:
+            items = items.filter(id__in=ids)
+        updated = items.update(read=True, read_at=timezone.now())
+        _adjust({user.pk: -updated})
+    return updated
+
+def release(items):
+    """
+    Take the unread ones of ``items`` out of the counts before they are
+    deleted, directly or by cascade. Call it in the deleting transaction.
+    """
+    # Locked so a concurrent mark_read cannot decrement them as well
+    unread = items.filter(read=False).select_for_update().order_by().values('recipient_id').annotate(n=Count('pk'))
+    _adjust({row['recipient_id']: -row['n'] for row in unread})
+
+def release_users(user_ids):
+    """
+    Take the items deleted by cascade with the users ``user_ids`` out of the
+    counts: those of their paperworks, whoever received them. Their own
+    counts go with them. Call it in the deleting transaction.
+    """
+    release(InboxItem.objects.filter(paper__researcher_id__in=user_ids))
+
+def unread_count(user):
+    return UnreadCount.objects.filter(recipient=user).values_list('count', flat=True).first() or 0
+
+def rebuild():
+    """Replace all UnreadCount rows with counts taken from the items. Returns the number of rows."""
+    with transaction.atomic():
+        grouped = (InboxItem.objects.filter(read=False).order_by()
+                   .values_list('recipient_id').annotate(count=Count('pk')))
+        rows = [UnreadCount(recipient_id=recipient_id, count=count) for recipient_id, count in grouped]
+        UnreadCount.objects.all().delete()
+        UnreadCount.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+def backfill(batch_size=1000):
+    """
+    Add read items for the notifications created before the inboxes, so
+    users keep their history without it showing up as unread. Returns the
+    number of items added.
+    """
+    admin_ids = list(User.objects.filter(role='ADMIN').values_list('id', flat=True))
+    notifications = (Notification.objects.filter(inbox_items__isnull=True)
+                     .values_list('id', 'event', 'paper_id', 'paper__researcher_id', 'at')
+                     .iterator(chunk_size=batch_size))
+    added = 0
+    batch = []
+    for notification_id, event, paper_id, researcher_id, at in notifications:
+        batch.extend(
+            InboxItem(recipient_id=recipient_id, notification_id=notification_id, event=event,
+                      paper_id=paper_id, at=at, read=True, read_at=at)
+            for recipient_id in _recipients(researcher_id, admin_ids)
+        )
+        if len(batch) >= batch_size:
+            InboxItem.objects.bulk_create(batch, ignore_conflicts=True)
+            added += len(batch)
+            batch = []
+    InboxItem.objects.bulk_create(batch, ignore_conflicts=True)
+    return added + len(batch)
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from admin_app.models import PaperWork
+from api import versionstats
+
+class Command(BaseCommand):
+    help = 'Recomputes the latest version and version count stored on every paperwork'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Paperworks updated per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        updated = 0
+        last_id = None
+        while True:
+            queryset = PaperWork.objects.order_by('id')
+            if last_id is not None:
+                queryset = queryset.filter(id__gt=last_id)
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += versionstats.refresh(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {updated} paperworks in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,132 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from auth_app.models import User
+from admin_app.models import PaperWork
+from api.models import Version, Notification, InboxItem, Review
+from api import inbox, views
+
+class Command(BaseCommand):
+    help = ('Seeds a large dataset into a scratch test database and reports query plans and endpoint '
+            'latency with and without the composite indexes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--researchers', type=int, default=200, help='Researchers to create.')
+        parser.add_argument('--papers', type=int, default=50, help='Paperworks per researcher.')
+        parser.add_argument('--versions', type=int, default=5, help='Versions, reviews and notifications per paperwork.')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests timed per endpoint.')
+
+    def handle(self, *args, **options):
+        # Seed and drop indexes in the database the test runner would create,
+        # never in the configured one; a replica mirrors it as in tests
+        old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+        try:
+            self.bench(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def bench(self, options):
+        started = time.perf_counter()
+        researchers, admin = self.seed(options)
+        self.stdout.write(f"Seeded {PaperWork.objects.count()} paperworks and {InboxItem.objects.count()} "
+                          f"inbox items in {time.perf_counter() - started:.1f}s")
+
+        researcher = researchers[len(researchers) // 2]
+        paperwork = PaperWork.objects.filter(researcher=researcher).order_by('id').first()
+        indexes = [(model, index) for model in (PaperWork, Version, Notification, InboxItem, Review)
+                   for index in model._meta.indexes]
+
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        before = self.measure(researcher, admin, paperwork, options['repeat'], 'without indexes')
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+        after = self.measure(researcher, admin, paperwork, options['repeat'], 'with indexes')
+
+        self.stdout.write(f"\n{'endpoint':<22} {'before p50':>11} {'after p50':>11} {'speedup':>8}")
+        for name in before:
+            self.stdout.write(f"{name:<22} {before[name] * 1000:>9.2f}ms {after[name] * 1000:>9.2f}ms "
+                              f"{before[name] / after[name]:>7.1f}x")
+
+    def seed(self, options):
+        admin = User.objects.create(username='bench-admin', email='bench-admin@example.com', role='ADMIN')
+        researchers = User.objects.bulk_create([
+            User(username=f"bench-{i}", email=f"bench-{i}@example.com", role='RESEARCHER')
+            for i in range(options['researchers'])
+        ])
+        statuses = [choice for choice, _ in PaperWork.STATUS_CHOICES]
+        for researcher in researchers:
+            papers = PaperWork.objects.bulk_create([
+                PaperWork(title=f"Paper {i}", researcher=researcher, status=statuses[i % len(statuses)],
+                          latest_version_no=options['versions'], version_count=options['versions'])
+                for i in range(options['papers'])
+            ])
+            Version.objects.bulk_create([
+                Version(paperwork=paper, version_no=no, pdf_path=f"bench/{paper.id}/{no}.pdf")
+                for paper in papers for no in range(1, options['versions'] + 1)
+            ])
+            Review.objects.bulk_create([
+                Review(paperwork=paper, status='CHANGES_REQUESTED', comments=f"Round {no}")
+                for paper in papers for no in range(options['versions'])
+            ])
+            notifications = Notification.objects.bulk_create([
+                Notification(event='SUBMITTED', paper=paper)
+                for paper in papers for _ in range(options['versions'])
+            ])
+            # Fanned out like inbox.deliver does, without pushing to the streams; every other item read
+            InboxItem.objects.bulk_create([
+                InboxItem(recipient_id=recipient_id, notification=notification, event=notification.event,
+                          paper_id=notification.paper_id, at=notification.at, read=i % 2 == 0)
+                for i, notification in enumerate(notifications)
+                for recipient_id in (researcher.id, admin.id)
+            ])
+        inbox.rebuild()
+        return researchers, admin
+
+    def measure(self, researcher, admin, paperwork, repeat, label):
+        """Print the query plan of each hot query and return the median latency of each endpoint."""
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nQuery plans {label}"))
+        queries = {
+            'researcher papers': PaperWork.objects.filter(researcher=researcher, status='SUBMITTED'),
+            'version by number': Version.objects.filter(paperwork=paperwork, version_no=1),
+            'paperwork reviews': Review.objects.filter(paperwork=paperwork).order_by('-created_at'),
+            'paper notifications': Notification.objects.filter(paper=paperwork).order_by('-at'),
+            'admin inbox': InboxItem.objects.filter(recipient=admin).order_by('-at', '-id')[:50],
+            'admin unread inbox': InboxItem.objects.filter(recipient=admin, read=False).order_by('-at', '-id')[:50],
+        }
+        for name, queryset in queries.items():
+            self.stdout.write(f"{name}:")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"    {line}")
+
+        factory = APIRequestFactory()
+        endpoints = {
+            'paperworks_list': (views.paperworks_list, researcher, '/', {}),
+            'versions_list': (views.versions_list, researcher, '/', {'id': paperwork.id}),
+            'version_detail': (views.version_detail, researcher, '/', {'id': paperwork.id, 'ver': 1}),
+            'paperwork_reviews': (views.paperwork_reviews, researcher, '/', {'id': paperwork.id}),
+            'notifications_list': (views.notifications_list, researcher, '/', {}),
+            'admin notifications': (views.notifications_list, admin, '/', {}),
+            'admin unread': (views.notifications_list, admin, '/?unread=true', {}),
+            'researcher_stats': (views.researcher_stats, researcher, '/', {}),
+        }
+        latencies = {}
+        for name, (view, user, path, kwargs) in endpoints.items():
+            timings = []
+            for _ in range(repeat):
+                request = factory.get(path)
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                response = view(request, **kwargs)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f"{name} returned {response.status_code}"))
+                    break
+            timings.sort()
+            latencies[name] = timings[len(timings) // 2]
+        return latencies
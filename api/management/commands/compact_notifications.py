@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import compaction
+from api.models import Notification, NotificationSummary
+
+class Command(BaseCommand):
+    help = ('Folds notifications older than the retention period into per paper, month and event summaries '
+            'and deletes them with their inbox items')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS,
+                            help='Notifications older than this many days are compacted.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Notifications compacted per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        compacted = compaction.compact(days=options['days'], batch_size=options['batch_size'],
+                                       max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {compacted} notifications in {time.perf_counter() - started:.2f}s; '
+            f'{Notification.objects.count()} notifications and '
+            f'{NotificationSummary.objects.count()} summaries remain'
+        ))
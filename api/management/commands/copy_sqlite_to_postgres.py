@@ -0,0 +1,114 @@
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from pms_server.databases import sqlite_database
+
+SOURCE_ALIAS = 'sqlite_source'
+
+class Command(BaseCommand):
+    help = ('Copies every table of an SQLite database into the default database (PostgreSQL) in bulk batches. '
+            'Run migrate on the target first; its existing rows in those tables are replaced.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.BASE_DIR / 'db.sqlite3'), help='SQLite file to copy.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per statement batch.')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Do not ask before replacing the rows in the target.')
+
+    def handle(self, *args, **options):
+        target = connections['default']
+        if target.vendor == 'sqlite' and str(target.settings_dict['NAME']) == options['source']:
+            raise CommandError('The default database is the source; set DATABASE_ENGINE=postgres first')
+
+        connections.settings[SOURCE_ALIAS] = connections.configure_settings(
+            {'default': sqlite_database(options['source'], tuned=False)}
+        )['default']
+        try:
+            models = self.copy_order()
+            if options['interactive']:
+                answer = input(f"This replaces the rows of {len(models)} tables in "
+                               f"{target.settings_dict['NAME']!r}. Type 'yes' to continue: ")
+                if answer != 'yes':
+                    raise CommandError('Copy cancelled')
+
+            started = time.perf_counter()
+            with transaction.atomic():
+                self.clear(target, models)
+                total = 0
+                for model in models:
+                    copied = self.copy(model, target, options['batch_size'])
+                    total += copied
+                    self.stdout.write(f"  {model._meta.db_table}: {copied} rows")
+                self.reset_sequences(target, models)
+            self.stdout.write(self.style.SUCCESS(
+                f'Copied {total} rows in {time.perf_counter() - started:.2f}s'
+            ))
+        finally:
+            connections[SOURCE_ALIAS].close()
+            del connections.settings[SOURCE_ALIAS]
+
+    def copy_order(self):
+        """Managed models whose table exists in the source, referenced tables first."""
+        existing = set(connections[SOURCE_ALIAS].introspection.table_names())
+        models = [model for model in apps.get_models(include_auto_created=True)
+                  if model._meta.managed and not model._meta.proxy and model._meta.db_table in existing]
+
+        ordered = []
+        def visit(model, path=()):
+            if model in ordered or model in path:
+                return
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model in models:
+                    visit(field.related_model, path + (model,))
+            ordered.append(model)
+        for model in models:
+            visit(model)
+        return ordered
+
+    def clear(self, target, models):
+        tables = [model._meta.db_table for model in models]
+        sql = target.ops.sql_flush(no_style(), tables, allow_cascade=True)
+        target.ops.execute_sql_flush(sql)
+
+    def copy(self, model, target, batch_size):
+        """
+        Copy one table with raw INSERTs, so auto_now fields keep their
+        original values. Rows are read in primary key order, one batch per
+        range query.
+        """
+        fields = [field for field in model._meta.concrete_fields if not field.generated]
+        quote = target.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        queryset = model._base_manager.using(SOURCE_ALIAS).order_by('pk')
+        names = [field.attname for field in fields]
+        pk_index = names.index(model._meta.pk.attname)
+
+        copied = 0
+        last_pk = None
+        with target.cursor() as cursor:
+            while True:
+                page = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+                rows = list(page.values_list(*names)[:batch_size])
+                if not rows:
+                    return copied
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(value, connection=target) for field, value in zip(fields, row)]
+                    for row in rows
+                ])
+                copied += len(rows)
+                last_pk = rows[-1][pk_index]
+
+    def reset_sequences(self, target, models):
+        statements = target.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with target.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
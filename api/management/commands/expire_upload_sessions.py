@@ -0,0 +1,19 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import uploads
+
+class Command(BaseCommand):
+    help = 'Aborts upload sessions that received no chunk within the TTL and deletes their staged files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-hours', type=int, default=settings.UPLOAD_SESSION_TTL_HOURS,
+                            help='Sessions idle for longer than this many hours are aborted.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        expired = uploads.expire_sessions(ttl_hours=options['ttl_hours'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {expired} upload sessions in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,132 @@
+import asyncio
+import resource
+import time
+import uuid
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auth_app.models import User
+from api import signedurls, streams
+
+class Command(BaseCommand):
+    help = ('Opens thousands of idle notification streams against the ASGI application in this process, '
+            'as one worker would hold them, then measures memory, event loop lag and broadcast latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000, help='Streams held open.')
+        parser.add_argument('--users', type=int, default=500, help='Distinct users the streams belong to.')
+        parser.add_argument('--idle', type=float, default=5, help='Seconds the streams stay idle.')
+        parser.add_argument('--rounds', type=int, default=5, help='Broadcasts to every user.')
+        parser.add_argument('--broker', choices=sorted(streams.BROKERS),
+                            help='Broker to publish through, NOTIFICATION_STREAM_BROKER by default.')
+
+    def handle(self, *args, **options):
+        if options['broker']:
+            settings.NOTIFICATION_STREAM_BROKER = options['broker']
+        prefix = f"streamload-{uuid.uuid4().hex[:8]}-"
+        users = User.objects.bulk_create(
+            User(username=f"{prefix}{i}", role='RESEARCHER') for i in range(options['users'])
+        )
+        try:
+            result = asyncio.run(self.run(users, options))
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write(f"broker:              {settings.NOTIFICATION_STREAM_BROKER}")
+        self.stdout.write(f"streams open:        {result['open']} of {options['connections']} "
+                          f"in {result['connect']:.2f}s")
+        self.stdout.write(f"memory per stream:   {result['memory'] / max(result['open'], 1) / 1024:.1f}KB "
+                          f"({result['memory'] / 2 ** 20:.1f}MB peak RSS growth)")
+        self.stdout.write(f"idle loop lag:       max {result['lag'] * 1000:.1f}ms over {options['idle']:.0f}s")
+        self.stdout.write(f"broadcast latency:   p50 {self.percentile(result['latencies'], 0.5):.1f}ms "
+                          f"p99 {self.percentile(result['latencies'], 0.99):.1f}ms "
+                          f"({len(result['latencies'])} deliveries)")
+        self.stdout.write(self.style.SUCCESS(f"closed cleanly:      {result['left'] == 0} ({result['left']} left)"))
+
+    async def run(self, users, options):
+        from pms_server.asgi import application
+
+        # Signed URLs as browsers open them, valid for the whole run
+        expires = int(time.time()) + 3600
+        queries = [urlencode(signedurls.sign_stream(user.pk, expires)) for user in users]
+        received = {}
+        closed = asyncio.Event()
+        first_event = {}
+
+        def connection(number):
+            query = queries[number % len(queries)]
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': '/api/notifications/stream/', 'raw_path': b'/api/notifications/stream/',
+                'query_string': query.encode(), 'root_path': '',
+                'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 10000 + number),
+                'server': ('localhost', 80), 'extensions': {},
+            }
+            requested = False
+            first_event[number] = asyncio.get_running_loop().create_future()
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await closed.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body' or not message.get('body'):
+                    if message['type'] == 'http.response.start' and message['status'] != 200:
+                        first_event[number].set_result(False)
+                    return
+                if not first_event[number].done():
+                    first_event[number].set_result(True)
+                for line in message['body'].decode().splitlines():
+                    if line.startswith('data: {"sent":'):
+                        received.setdefault(number, []).append((time.perf_counter(), line))
+            return application(scope, receive, send)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(connection(number)) for number in range(options['connections'])]
+        opened = await asyncio.gather(*first_event.values())
+        connect = time.perf_counter() - started
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - rss_before
+
+        # How late the loop wakes up while only idle streams are held
+        lag = 0.0
+        deadline = time.perf_counter() + options['idle']
+        while time.perf_counter() < deadline:
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - before - 0.01)
+
+        # Publish from a worker thread, as a view committing a review would
+        latencies = []
+        publish = sync_to_async(streams.broker().publish, thread_sensitive=False)
+        for round_number in range(options['rounds']):
+            received.clear()
+            sent = time.perf_counter()
+            now = timezone.now().isoformat()
+            await publish([
+                (str(user.pk), {'sent': sent, 'round': round_number, 'at': now}) for user in users
+            ])
+            expected = sum(opened)
+            wait_until = time.perf_counter() + 10
+            while sum(len(events) for events in received.values()) < expected and time.perf_counter() < wait_until:
+                await asyncio.sleep(0.005)
+            latencies.extend((at - sent) * 1000 for events in received.values() for at, _ in events)
+        latencies.sort()
+
+        closed.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return {
+            'open': sum(opened), 'connect': connect, 'memory': memory, 'lag': lag,
+            'latencies': latencies, 'left': streams.hub().connections(),
+        }
+
+    @staticmethod
+    def percentile(values, fraction):
+        return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
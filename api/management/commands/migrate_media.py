@@ -0,0 +1,143 @@
+import hashlib
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from api.models import Version
+from api import blobstore, storage, zipindex
+
+class Command(BaseCommand):
+    help = ('Moves version files from the old flat <type>_files/<paperwork_id>/vN/ layout into the sharded '
+            'blob store, rewriting Version paths in bulk, and optionally rebalances blobs across MEDIA_VOLUMES')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Versions rewritten per transaction.')
+        parser.add_argument('--rebalance', action='store_true',
+                            help='Move blobs from fuller volumes to emptier ones afterwards.')
+        parser.add_argument('--tolerance', type=float, default=0.05,
+                            help='Allowed difference in fill ratio between volumes when rebalancing.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be done.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.migrate_legacy(options['batch_size'])
+        if options['rebalance']:
+            self.rebalance(options['tolerance'])
+
+    def migrate_legacy(self, batch_size):
+        legacy = Q()
+        for field in blobstore.PATH_FIELDS:
+            legacy |= Q(**{f'{field}__isnull': False}) & ~Q(**{f'{field}__startswith': f'{settings.BLOB_STORAGE_PATH}/'})
+        queryset = Version.objects.filter(legacy).order_by('id')
+
+        migrated = missing = 0
+        last_id = None
+        while True:
+            page = queryset.filter(id__gt=last_id) if last_id else queryset
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            if self.dry_run:
+                migrated += len(batch)
+                continue
+
+            # Hash outside the transaction, it is the slow part
+            staged = {}
+            legacy_zips = []
+            for version in batch:
+                for field in blobstore.PATH_FIELDS:
+                    rel_path = getattr(version, field)
+                    if not rel_path or blobstore.is_blob_path(rel_path):
+                        continue
+                    full_path = storage.locate(rel_path)
+                    if full_path is None:
+                        missing += 1
+                        self.stdout.write(self.style.WARNING(f'Missing {rel_path} of version {version.id}'))
+                        continue
+                    staged[(version.id, field)] = blobstore.StagedFile(full_path, *self.hash_file(full_path))
+                    if field == 'python_path':
+                        legacy_zips.append(rel_path)
+
+            with transaction.atomic():
+                for version in batch:
+                    for field in blobstore.PATH_FIELDS:
+                        staged_file = staged.get((version.id, field))
+                        if staged_file:
+                            setattr(version, field, blobstore.add_reference(staged_file))
+                Version.objects.bulk_update(batch, blobstore.PATH_FIELDS)
+            # Indexes are keyed by path, the migrated ZIPs are indexed again under their blob
+            for rel_path in legacy_zips:
+                zipindex.forget(rel_path)
+            migrated += len(batch)
+
+        if not self.dry_run:
+            self.remove_empty_legacy_folders()
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would migrate" if self.dry_run else "Migrated"} {migrated} versions, {missing} files missing'
+        ))
+
+    def hash_file(self, full_path):
+        digest = hashlib.sha256()
+        size = 0
+        with open(full_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(blobstore.CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def remove_empty_legacy_folders(self):
+        for volume in storage.volumes():
+            for storage_path in [settings.PDF_STORAGE_PATH, settings.LATEX_STORAGE_PATH,
+                                 settings.PYTHON_STORAGE_PATH, settings.DOCX_STORAGE_PATH]:
+                root = storage.path_on(volume, storage_path)
+                for folder, _, _ in os.walk(root, topdown=False):
+                    if not os.listdir(folder):
+                        os.rmdir(folder)
+
+    def rebalance(self, tolerance):
+        volumes = storage.volumes()
+        if len(volumes) < 2:
+            self.stdout.write('Only one media volume configured, nothing to rebalance')
+            return
+
+        usage = {volume: list(used_total) for volume, used_total in storage.usage().items()}
+        target = sum(used for used, _ in usage.values()) / sum(total for _, total in usage.values())
+        moved = moved_bytes = 0
+
+        for volume in volumes:
+            if usage[volume][0] / usage[volume][1] <= target + tolerance:
+                continue
+            blob_root = storage.path_on(volume, settings.BLOB_STORAGE_PATH)
+            for folder, subfolders, files in os.walk(blob_root):
+                if folder in (blobstore.staging_folder(volume), blobstore.lock_folder()):
+                    subfolders[:] = []
+                    continue
+                for name in files:
+                    if name.endswith(storage.MOVING_SUFFIX):
+                        if not self.dry_run:
+                            blobstore.remove_interrupted_move(os.path.join(folder, name))
+                        continue
+                    if usage[volume][0] / usage[volume][1] <= target:
+                        break
+                    destination = min(volumes, key=lambda v: usage[v][0] / usage[v][1])
+                    if destination == volume:
+                        break
+                    try:
+                        size = os.path.getsize(os.path.join(folder, name))
+                    except FileNotFoundError:
+                        # Pruned since the folder was listed
+                        continue
+                    if not self.dry_run and not blobstore.move(name, destination):
+                        continue
+                    usage[volume][0] -= size
+                    usage[destination][0] += size
+                    moved += 1
+                    moved_bytes += size
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would move" if self.dry_run else "Moved"} {moved} blobs ({moved_bytes / 2 ** 20:.1f} MiB)'
+        ))
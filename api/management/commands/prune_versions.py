@@ -0,0 +1,20 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import retention
+
+class Command(BaseCommand):
+    help = 'Deletes versions beyond each paperwork\'s retention count together with their unreferenced files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=250, help='Versions deleted per transaction.')
+        parser.add_argument('--workers', type=int, default=settings.VERSION_PRUNE_WORKERS,
+                            help='Threads used to delete files.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        removed = retention.prune(batch_size=options['batch_size'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {removed} versions in {time.perf_counter() - started:.2f}s'
+        ))
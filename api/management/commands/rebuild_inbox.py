@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+
+from api import inbox
+
+class Command(BaseCommand):
+    help = 'Recomputes the unread notification counts from the inbox items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='First add read inbox items for notifications that have none.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['backfill']:
+            added = inbox.backfill()
+            self.stdout.write(f'Added {added} inbox items')
+        rows = inbox.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rows} unread counts in {time.perf_counter() - started:.2f}s'
+        ))
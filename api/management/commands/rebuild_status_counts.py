@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+
+from api import statuscounts
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-researcher and global paperwork counts behind PAPERWORK_STATUS_COUNTS'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = statuscounts.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rows} status counts in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction, OperationalError
+
+from auth_app.models import User
+from admin_app.models import PaperWork
+from api.models import Notification, Review
+from pms_server.databases import sqlite_database
+
+class Command(BaseCommand):
+    help = ('Runs concurrent review-style writers and list readers against a scratch SQLite database '
+            'with default and tuned settings and reports lock errors and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads.')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads.')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each run.')
+        parser.add_argument('--papers', type=int, default=200, help='Paperworks in the scratch database.')
+        parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'],
+                            help="Profiles to compare: 'default' (SQLite defaults) and 'tuned'.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as folder:
+            results = {}
+            for profile in options['profiles']:
+                alias = f'stress_{profile}'
+                database = sqlite_database(os.path.join(folder, f'{profile}.sqlite3'),
+                                           tuned=profile == 'tuned', busy_timeout=settings.SQLITE_BUSY_TIMEOUT)
+                connections.settings[alias] = connections.configure_settings({'default': database})['default']
+                try:
+                    paper_ids = self.prepare(alias, options['papers'])
+                    results[profile] = self.run(alias, paper_ids, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+        self.stdout.write(f"\n{'profile':<10} {'writes':>8} {'writes/s':>9} {'locked':>8} {'lock rate':>10} "
+                          f"{'p50':>8} {'p99':>8} {'reads':>8}")
+        for profile, result in results.items():
+            latencies = result['latencies']
+            attempts = len(latencies) + result['locked']
+            self.stdout.write(
+                f"{profile:<10} {len(latencies):>8} {len(latencies) / options['seconds']:>9.1f} "
+                f"{result['locked']:>8} {result['locked'] / max(attempts, 1):>9.1%} "
+                f"{self.percentile(latencies, 0.5):>6.1f}ms {self.percentile(latencies, 0.99):>6.1f}ms "
+                f"{result['reads']:>8}"
+            )
+            for error, count in result['errors'].most_common(3):
+                self.stdout.write(self.style.WARNING(f"  {count}x {error}"))
+
+    def prepare(self, alias, papers):
+        with connections[alias].schema_editor() as editor:
+            for model in (User, PaperWork, Review, Notification):
+                editor.create_model(model)
+        researcher = User.objects.using(alias).create(username=f"stress-{uuid.uuid4().hex[:8]}", role='RESEARCHER')
+        created = PaperWork.objects.using(alias).bulk_create(
+            PaperWork(title=f"Paper {i}", researcher=researcher, status='SUBMITTED') for i in range(papers)
+        )
+        return [paper.id for paper in created]
+
+    def run(self, alias, paper_ids, options):
+        latencies = []
+        errors = Counter()
+        counts = Counter()
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def writer(number):
+            # Same shape as review_paperwork: read the paper, change it, add a review and a notification
+            try:
+                i = number
+                while time.perf_counter() < deadline:
+                    paper_id = paper_ids[i % len(paper_ids)]
+                    i += options['writers']
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic(using=alias):
+                            paperwork = PaperWork.objects.using(alias).get(id=paper_id)
+                            paperwork.status = 'APPROVED' if paperwork.status != 'APPROVED' else 'CHANGES_REQUESTED'
+                            paperwork.save(using=alias)
+                            Review.objects.using(alias).create(paperwork=paperwork, status=paperwork.status,
+                                                               comments='Looks good')
+                            Notification.objects.using(alias).create(event=paperwork.status, paper=paperwork)
+                    except OperationalError as e:
+                        with lock:
+                            counts['locked'] += 'locked' in str(e)
+                            errors[str(e)] += 1
+                        continue
+                    with lock:
+                        latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[alias].close()
+
+        def reader():
+            try:
+                while time.perf_counter() < deadline:
+                    try:
+                        list(Notification.objects.using(alias).select_related('paper').order_by('-at')[:50])
+                        with lock:
+                            counts['reads'] += 1
+                    except OperationalError as e:
+                        with lock:
+                            errors[str(e)] += 1
+            finally:
+                connections[alias].close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(options['writers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        latencies.sort()
+        return {'latencies': latencies, 'locked': counts['locked'], 'reads': counts['reads'], 'errors': errors}
+
+    @staticmethod
+    def percentile(values, fraction):
+        return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from auth_app.models import User
+from admin_app.models import PaperWork
+from api.models import Version, Blob
+from api import blobstore, inbox, retention, statuscounts, storage
+from api.submissions import submit_version
+
+class Command(BaseCommand):
+    help = 'Submits versions of one paperwork from many threads and checks for duplicate or orphaned versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent submitters.')
+        parser.add_argument('--submissions', type=int, default=25, help='Submissions per thread.')
+        parser.add_argument('--size', type=int, default=64 * 1024, help='Size in bytes of each submitted file.')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated user, paperwork and files.')
+
+    def handle(self, *args, **options):
+        researcher = User.objects.create_user(
+            username=f"stress-{uuid.uuid4().hex[:8]}",
+            email='stress@example.com',
+            password=None,
+            role='RESEARCHER'
+        )
+        with transaction.atomic():
+            paperwork = PaperWork.objects.create(title='Submission stress test', researcher=researcher)
+            statuscounts.record_transition(researcher.id, None, paperwork.status)
+        # The same code.zip in every submission exercises blob deduplication
+        shared_zip = os.urandom(options['size'])
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def submitter():
+            try:
+                for _ in range(options['submissions']):
+                    staged = {
+                        'pdf_path': blobstore.stage_chunks([os.urandom(options['size'])]),
+                        'latex_path': blobstore.stage_chunks([os.urandom(1024)]),
+                        'python_path': blobstore.stage_chunks([shared_zip]),
+                    }
+                    started = time.perf_counter()
+                    try:
+                        # Notify no admin, so real inboxes and streams see nothing of the test
+                        submit_version(PaperWork.objects.get(pk=paperwork.pk), staged, admin_ids=[])
+                    except Exception as e:
+                        with lock:
+                            errors.append(repr(e))
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submitter) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        submitted = len(latencies)
+        self.stdout.write(f"Submitted {submitted} versions in {elapsed:.2f}s "
+                          f"({submitted / elapsed:.1f}/s), {len(errors)} failed")
+        if latencies:
+            self.stdout.write(f"Latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+                              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+        for error in Counter(errors).most_common(5):
+            self.stdout.write(self.style.WARNING(f"  {error[1]}x {error[0]}"))
+
+        # Settle retention of this paperwork only before checking what was kept
+        self.prune(paperwork)
+        problems = self.check_consistency(paperwork, submitted)
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('No duplicate or orphaned versions'))
+
+        if not options['keep']:
+            with transaction.atomic():
+                rows = list(Version.objects.filter(paperwork=paperwork).values_list('id', *blobstore.PATH_FIELDS))
+                removable = retention.delete_versions(rows)
+                inbox.release_users([researcher.id])
+                paperwork.refresh_from_db(fields=['status'])
+                statuscounts.record_transition(researcher.id, paperwork.status, None)
+                researcher.delete()
+            blobstore.unlink_files(removable)
+
+    @staticmethod
+    def prune(paperwork):
+        while True:
+            rows = list(retention.prunable_versions().filter(paperwork=paperwork)
+                        .values_list('id', *blobstore.PATH_FIELDS))
+            if not rows:
+                return
+            try:
+                with transaction.atomic():
+                    removable = retention.delete_versions(rows)
+            except retention.ConcurrentDeletion:
+                # The in-process pruner got there first
+                continue
+            blobstore.unlink_files(removable)
+
+    def check_consistency(self, paperwork, submitted):
+        problems = []
+        paperwork.refresh_from_db()
+
+        duplicates = Version.objects.values('paperwork', 'version_no').annotate(n=Count('id')).filter(n__gt=1)
+        if duplicates:
+            problems.append(f"Duplicate version numbers: {list(duplicates)}")
+        if paperwork.latest_version_no != submitted:
+            problems.append(f"Counter at {paperwork.latest_version_no} after {submitted} submissions")
+        kept = Version.objects.filter(paperwork=paperwork).count()
+        expected = min(submitted, paperwork.retention_count or settings.VERSION_RETENTION_COUNT)
+        if kept != expected:
+            problems.append(f"{kept} versions kept, expected {expected}")
+        if paperwork.version_count != kept:
+            problems.append(f"version_count is {paperwork.version_count}, {kept} versions exist")
+
+        # Reference counts must match the Version rows pointing at each blob
+        references = Counter()
+        for paths in Version.objects.values_list(*blobstore.PATH_FIELDS):
+            references.update(os.path.basename(path) for path in paths if blobstore.is_blob_path(path))
+        blobs = dict(Blob.objects.values_list('sha256', 'ref_count'))
+        for sha256 in set(references) | set(blobs):
+            if references[sha256] != blobs.get(sha256, 0):
+                problems.append(f"Blob {sha256} has ref_count {blobs.get(sha256, 0)}, "
+                                f"referenced {references[sha256]} times")
+            elif not storage.locate(blobstore.blob_path(sha256)):
+                problems.append(f"Blob {sha256} is missing on disk")
+
+        # Files without a Blob row are orphans
+        for volume in storage.volumes():
+            for folder, subfolders, files in os.walk(storage.path_on(volume, settings.BLOB_STORAGE_PATH)):
+                if folder in (blobstore.staging_folder(volume), blobstore.lock_folder()):
+                    subfolders[:] = []
+                    continue
+                for name in files:
+                    if name not in blobs:
+                        problems.append(f"Orphaned blob file {os.path.join(folder, name)}")
+        return problems
@@ -1,6 +1,7 @@
 from django.db import models
 import uuid
 from admin_app.models import PaperWork
+from auth_app.models import User
 
 class Review(models.Model):
     STATUS_CHOICES = (
@@ -21,6 +22,19 @@ class Review(models.Model):
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['paperwork', '-created_at', '-id'], name='review_paperwork_created'),
+        ]
+
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Blob'
+        verbose_name_plural = 'Blobs'
 
 class Version(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -38,6 +52,10 @@ class Version(models.Model):
         verbose_name = 'Version'
         verbose_name_plural = 'Versions'
         ordering = ['-version_no']
+        # Also the index for looking up a paperwork's versions by number
+        constraints = [
+            models.UniqueConstraint(fields=['paperwork', 'version_no'], name='unique_version_no_per_paperwork'),
+        ]
 
 class Notification(models.Model):
     EVENT_CHOICES = (
@@ -56,3 +74,120 @@ class Notification(models.Model):
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
         ordering = ['-at']
+        indexes = [
+            models.Index(fields=['paper', '-at', '-id'], name='notification_paper_at'),
+            models.Index(fields=['-at', '-id'], name='notification_at'),
+        ]
+
+class NotificationSummary(models.Model):
+    # Notifications past NOTIFICATION_RETENTION_DAYS, counted per paper, month and event
+    paper = models.ForeignKey(PaperWork, on_delete=models.CASCADE, related_name='notification_summaries')
+    month = models.DateField()
+    event = models.CharField(max_length=20, choices=Notification.EVENT_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Notification Summary'
+        verbose_name_plural = 'Notification Summaries'
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['paper', 'month', 'event'], name='unique_notification_summary'),
+        ]
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = (
+        ('OPEN', 'Open'),
+        ('COMMITTED', 'Committed'),
+        ('ABORTED', 'Aborted'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    paperwork = models.ForeignKey(PaperWork, on_delete=models.CASCADE, related_name='upload_sessions')
+    # Allocated when the session is committed
+    version_no = models.PositiveIntegerField(null=True, blank=True)
+    ai_percent_self = models.FloatField(default=0.0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Upload Session'
+        verbose_name_plural = 'Upload Sessions'
+        ordering = ['-created_at']
+
+class UploadPart(models.Model):
+    FIELD_CHOICES = (
+        ('paper_pdf', 'Paper PDF'),
+        ('latex_tex', 'LaTeX Source'),
+        ('python_zip', 'Python ZIP'),
+        ('docx_file', 'DOCX File'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    path = models.CharField(max_length=255)
+    
+    class Meta:
+        verbose_name = 'Upload Part'
+        verbose_name_plural = 'Upload Parts'
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'field'], name='unique_upload_part_field'),
+        ]
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+class StatusCount(models.Model):
+    # Null researcher is the row counting every paperwork
+    researcher = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='status_counts')
+    status = models.CharField(max_length=20, choices=PaperWork.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Status Count'
+        verbose_name_plural = 'Status Counts'
+        constraints = [
+            models.UniqueConstraint(fields=['researcher', 'status'], name='unique_status_count_per_researcher'),
+            models.UniqueConstraint(fields=['status'], condition=models.Q(researcher__isnull=True),
+                                    name='unique_global_status_count'),
+        ]
+
+class InboxItem(models.Model):
+    # One row per recipient of a notification, see api/inbox.py
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='inbox_items')
+    # Copied from the notification so the inbox is read without a join
+    event = models.CharField(max_length=20, choices=Notification.EVENT_CHOICES)
+    paper = models.ForeignKey(PaperWork, on_delete=models.CASCADE, related_name='inbox_items')
+    at = models.DateTimeField()
+    read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Inbox Item'
+        verbose_name_plural = 'Inbox Items'
+        ordering = ['-at']
+        indexes = [
+            models.Index(fields=['recipient', '-at', '-id'], name='inbox_recipient_at'),
+            models.Index(fields=['recipient', '-at', '-id'], condition=models.Q(read=False),
+                         name='inbox_recipient_unread'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'notification'], name='unique_inbox_item_per_recipient'),
+        ]
+
+class UnreadCount(models.Model):
+    recipient = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_count')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Unread Count'
+        verbose_name_plural = 'Unread Counts'
@@ -0,0 +1,143 @@
+"""
+Read replica routing.
+
+GET views decorated with ``replica_read`` send their reads to the
+``replica`` database: a PostgreSQL standby or a read-only connection to the
+SQLite file. Everything else, and every write, uses ``default``. Reads fall
+back to ``default``
+
+- inside a transaction on ``default``,
+- for REPLICA_STICKY_SECONDS after the same user's last successful write,
+  so users always see their own changes,
+- while a PostgreSQL replica is more than REPLICA_MAX_LAG seconds behind
+  or unreachable. Lag is checked at most every REPLICA_LAG_CHECK_INTERVAL
+  seconds.
+
+The write timestamps live in the default cache, which every worker must
+share (CACHE_BACKEND); with a per-process cache a write in one worker would
+not keep the next read in another off the replica, so all reads then go to
+``default``.
+"""
+import contextvars
+import functools
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, DatabaseError
+
+from pms_server import caches
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+
+# True while a replica_read view runs for a request that may use the replica
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+_lag_lock = threading.Lock()
+_lag_state = {'checked': None, 'usable': True}
+
+# Seconds the replica is behind, 0 while it has replayed everything it received
+POSTGRES_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+def _sticky_key(user_id):
+    return f'replicas:last-write:{user_id}'
+
+def record_write(user):
+    """Keep ``user``'s reads on the primary for the sticky window."""
+    cache.set(_sticky_key(user.pk), time.time(), timeout=settings.REPLICA_STICKY_SECONDS)
+
+def wrote_recently(user):
+    written_at = cache.get(_sticky_key(user.pk))
+    return written_at is not None and time.time() - written_at < settings.REPLICA_STICKY_SECONDS
+
+def replica_usable():
+    """
+    Whether the replica is configured, the sticky windows are shared by all
+    workers and, for PostgreSQL, the replica is close enough behind the primary.
+    """
+    if REPLICA not in connections.settings or not caches.shared():
+        return False
+    if connections[REPLICA].vendor != 'postgresql':
+        return True
+
+    with _lag_lock:
+        now = time.monotonic()
+        checked = _lag_state['checked']
+        if checked is not None and now - checked < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return _lag_state['usable']
+        _lag_state['checked'] = now
+    try:
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+        usable = lag <= settings.REPLICA_MAX_LAG
+        if not usable:
+            logger.warning('Replica is %.1fs behind, reading from the primary', lag)
+    except DatabaseError:
+        logger.exception('Replica lag check failed, reading from the primary')
+        usable = False
+    _lag_state['usable'] = usable
+    return usable
+
+def read_database():
+    """Alias reads go to right now; use it to pin querysets evaluated after the view returns."""
+    if _use_replica.get() and not connections['default'].in_atomic_block and replica_usable():
+        return REPLICA
+    return 'default'
+
+def replica_read(view):
+    """
+    Let the reads of a view go to the replica for safe requests.
+
+    Apply it below ``api_view`` and ``permission_classes`` so the request is
+    authenticated by the time the sticky window is checked.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return view(request, *args, **kwargs)
+        user = getattr(request, 'user', None)
+        sticky = user is not None and user.is_authenticated and wrote_recently(user)
+        token = _use_replica.set(not sticky)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+class ReplicaRouter:
+    """Database router sending replica_read views' reads to the replica and all writes to default."""
+
+    def db_for_read(self, model, **hints):
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+class StickyWriteMiddleware:
+    """Records successful unsafe requests of authenticated users for read-your-writes stickiness."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            # DRF copies the user it authenticated onto the Django request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                record_write(user)
+        return response
@@ -0,0 +1,119 @@
+"""
+Report summary and export.
+
+The summary is one query grouping paperworks by researcher and status, or
+grouping the StatusCount rows when PAPERWORK_STATUS_COUNTS is on, with the
+average verified AI percentage as a scalar subquery in the same statement.
+
+The CSV export is produced from one query that joins the researcher and
+reads each paper's latest version from the fields denormalized onto
+PaperWork, without touching the Version table. Rows are fetched in
+keyset-paginated chunks of that query rather than through one long-lived
+cursor, so under ASGI every chunk can be fetched in its own database call
+while the response is being streamed.
+"""
+import csv
+import datetime
+import uuid
+from django.conf import settings
+from django.db.models import Avg, Count, Q, Subquery, Value
+from django.utils import timezone
+
+from admin_app.models import PaperWork
+from .models import StatusCount, Version
+
+EXPORT_HEADER = ['ID', 'Title', 'Researcher', 'Status', 'Assigned At', 'Latest Version', 'AI Percentage']
+EXPORT_CHUNK_SIZE = 2000
+
+class Echo:
+    """File-like object whose ``write`` returns the value, for streaming ``csv.writer`` output."""
+
+    def write(self, value):
+        return value
+
+def _start_of_day(date):
+    start = datetime.datetime.combine(date, datetime.time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+def summary():
+    """Totals by status and by researcher plus the average verified AI percentage over all versions."""
+    average = Version.objects.order_by().annotate(everything=Value(1)).values('everything').annotate(
+        average=Avg('ai_percent_verified')
+    ).values('average')
+    if settings.PAPERWORK_STATUS_COUNTS:
+        rows = StatusCount.objects.filter(researcher__isnull=False, count__gt=0).values_list(
+            'researcher__username', 'status', 'count'
+        ).annotate(average_ai=Subquery(average))
+    else:
+        rows = PaperWork.objects.order_by().values_list('researcher__username', 'status').annotate(
+            count=Count('pk'), average_ai=Subquery(average)
+        )
+
+    by_status = {}
+    by_researcher = {}
+    average_ai = None
+    for username, paper_status, count, average_ai in rows:
+        by_status[paper_status] = by_status.get(paper_status, 0) + count
+        by_researcher[username] = by_researcher.get(username, 0) + count
+    return {
+        'total_papers': sum(by_status.values()),
+        'papers_by_status': by_status,
+        'papers_by_researcher': by_researcher,
+        'average_ai_percentage': average_ai or 0,
+    }
+
+def export_queryset(statuses=None, researcher=None, assigned_from=None, assigned_to=None):
+    """
+    Rows of the export, filtered in SQL.
+
+    ``researcher`` is a user id or username; ``assigned_from`` and
+    ``assigned_to`` are inclusive dates.
+    """
+    queryset = PaperWork.objects.all()
+
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    if researcher:
+        try:
+            queryset = queryset.filter(researcher_id=uuid.UUID(str(researcher)))
+        except ValueError:
+            queryset = queryset.filter(researcher__username=researcher)
+    if assigned_from:
+        queryset = queryset.filter(assigned_at__gte=_start_of_day(assigned_from))
+    if assigned_to:
+        queryset = queryset.filter(assigned_at__lt=_start_of_day(assigned_to + datetime.timedelta(days=1)))
+
+    return queryset.order_by('assigned_at', 'id').values_list(
+        'id', 'title', 'researcher__username', 'status', 'assigned_at',
+        'version_count', 'latest_version_no', 'latest_ai_percent_verified'
+    )
+
+def iter_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of rows, fetching ``chunk_size`` rows per query after the last (assigned_at, id) seen."""
+    page = queryset
+    while True:
+        rows = list(page[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        assigned_at, last_id = rows[-1][4], rows[-1][0]
+        page = queryset.filter(Q(assigned_at__gt=assigned_at) | Q(assigned_at=assigned_at, id__gt=last_id))
+
+def csv_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSV text of the export, one string per chunk of rows."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for rows in iter_rows(queryset, chunk_size):
+        yield ''.join(
+            writer.writerow([
+                paper_id,
+                title,
+                username,
+                paper_status,
+                assigned_at.strftime('%Y-%m-%d'),
+                latest_no if version_count else 'N/A',
+                latest_ai if version_count else 'N/A',
+            ])
+            for paper_id, title, username, paper_status, assigned_at, version_count, latest_no, latest_ai in rows
+        )
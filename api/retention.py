@@ -0,0 +1,99 @@
+"""
+Version retention.
+
+Old versions are pruned in batches outside the submission request, either by
+the in-process worker that submissions wake up or by ``manage.py
+prune_versions``. Each paperwork keeps ``retention_count`` versions, falling
+back to ``VERSION_RETENTION_COUNT``.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from .models import Version
+from . import blobstore, versionstats
+
+logger = logging.getLogger(__name__)
+
+def prunable_versions():
+    """Versions beyond their paperwork's retention count, for all papers in one query."""
+    return Version.objects.annotate(
+        rank=Window(RowNumber(), partition_by=[F('paperwork_id')], order_by=F('version_no').desc()),
+        keep=Coalesce(F('paperwork__retention_count'), Value(settings.VERSION_RETENTION_COUNT)),
+    ).filter(rank__gt=F('keep'))
+
+class ConcurrentDeletion(Exception):
+    pass
+
+def delete_versions(rows):
+    """
+    Delete versions and release their file references.
+
+    ``rows`` are ``(id, pdf_path, latex_path, python_path, docx_path)``
+    tuples. Must run inside a transaction. If another transaction deleted
+    some of the rows first, ConcurrentDeletion is raised so the caller rolls
+    back instead of releasing those references twice. The version fields of
+    the affected paperworks are recomputed. Returns the paths to unlink once
+    the transaction commits.
+    """
+    ids = [row[0] for row in rows]
+    paperwork_ids = set(Version.objects.filter(id__in=ids).values_list('paperwork_id', flat=True))
+    _, deleted = Version.objects.filter(id__in=ids).delete()
+    if deleted.get(Version._meta.label, 0) != len(ids):
+        raise ConcurrentDeletion('Versions were deleted concurrently')
+    versionstats.refresh(paperwork_ids)
+    return blobstore.release_references(path for row in rows for path in row[1:])
+
+def prune(batch_size=250, workers=None):
+    """Prune every paperwork down to its retention count. Returns the number of versions removed."""
+    workers = workers or settings.VERSION_PRUNE_WORKERS
+    removed = 0
+    while True:
+        batch = list(prunable_versions().values_list('id', *blobstore.PATH_FIELDS)[:batch_size])
+        if not batch:
+            return removed
+
+        try:
+            with transaction.atomic():
+                removable = delete_versions(batch)
+        except ConcurrentDeletion:
+            # Another pruner got there first, select a fresh batch
+            continue
+        blobstore.unlink_files(removable, workers=workers)
+        removed += len(batch)
+
+class PruneWorker(threading.Thread):
+    """Daemon thread that prunes whenever a submission signals new versions."""
+
+    def __init__(self):
+        super().__init__(name='version-pruner', daemon=True)
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                prune()
+            except Exception:
+                logger.exception('Version pruning failed')
+            finally:
+                close_old_connections()
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def schedule():
+    """Ask the in-process worker to prune soon; a no-op when it is disabled."""
+    global _worker
+    if not settings.VERSION_PRUNE_IN_PROCESS:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = PruneWorker()
+            _worker.start()
+    _worker.wakeup.set()
@@ -1,10 +1,12 @@
 from rest_framework import serializers
-from .models import Version, Notification, Review
+from .models import Version, Notification, InboxItem, Review, UploadSession, UploadPart
 from admin_app.models import PaperWork
 from admin_app.serializers import PaperWorkSerializer
+from .expansion import ExpandableSerializerMixin
 
-class VersionSerializer(serializers.ModelSerializer):
+class VersionSerializer(ExpandableSerializerMixin, serializers.ModelSerializer):
     paperwork = PaperWorkSerializer(read_only=True)
+    expandable_fields = {'paperwork': PaperWorkSerializer}
     
     class Meta:
         model = Version
@@ -37,14 +39,27 @@ class VersionCreateSerializer(serializers.ModelSerializer):
         
         return version
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(ExpandableSerializerMixin, serializers.ModelSerializer):
     paper = PaperWorkSerializer(read_only=True)
+    expandable_fields = {'paper': PaperWorkSerializer}
     
     class Meta:
         model = Notification
         fields = ['id', 'event', 'paper', 'at']
         read_only_fields = ['id', 'at']
 
+class InboxItemSerializer(ExpandableSerializerMixin, serializers.ModelSerializer):
+    paper = PaperWorkSerializer(read_only=True)
+    expandable_fields = {'paper': PaperWorkSerializer}
+    
+    class Meta:
+        model = InboxItem
+        fields = ['id', 'notification', 'event', 'paper', 'at', 'read', 'read_at']
+        read_only_fields = fields
+
+class MarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=1000)
+
 class ReviewModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
@@ -76,4 +91,38 @@ class AdminStatsSerializer(serializers.Serializer):
     total_paperwork = serializers.IntegerField()
     submitted = serializers.IntegerField()
     approved = serializers.IntegerField()
-    changes_requested = serializers.IntegerField()
\ No newline at end of file
+    changes_requested = serializers.IntegerField()
+
+class UploadPartSerializer(serializers.ModelSerializer):
+    complete = serializers.BooleanField(source='is_complete', read_only=True)
+    
+    class Meta:
+        model = UploadPart
+        fields = ['field', 'size', 'sha256', 'offset', 'complete']
+        read_only_fields = fields
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    parts = UploadPartSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'paperwork', 'version_no', 'ai_percent_self', 'status', 'parts', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+class UploadPartSpecSerializer(serializers.Serializer):
+    size = serializers.IntegerField(min_value=0)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    ai_percent_self = serializers.FloatField(required=False, default=0.0)
+    files = serializers.DictField(child=UploadPartSpecSerializer())
+    
+    def validate_files(self, value):
+        allowed = dict(UploadPart.FIELD_CHOICES)
+        unknown = [name for name in value if name not in allowed]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown file fields: {', '.join(unknown)}")
+        missing = [name for name in ('paper_pdf', 'latex_tex', 'python_zip') if name not in value]
+        if missing:
+            raise serializers.ValidationError(f"Missing required files: {', '.join(missing)}")
+        return value
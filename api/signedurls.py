@@ -0,0 +1,97 @@
+"""
+Signed file URLs.
+
+The file views take short-lived URLs signed for one (paperwork, version,
+file type, user) instead of an access token in the query string. The
+signature is an HMAC over those values and the expiry, keyed with
+SECRET_KEY, so checking it needs no query and the access token never ends
+up in logs, browser history or proxy caches.
+
+``file_type`` is the one of the URL for plain files; every ZIP listing and
+member endpoint of a version shares the scope ``zip``. Expiry times are
+rounded up to the next multiple of SIGNED_URL_TTL, so a file keeps the same
+URL for a while and caches in front of the application can reuse it. A URL
+is therefore valid for between one and two SIGNED_URL_TTL.
+
+Browsers' EventSource cannot send an Authorization header either, so the
+notification stream takes the same parameters signed for one user under
+their own salt. Those URLs are valid for NOTIFICATION_STREAM_URL_TTL
+seconds after they are issued and only needed to open a stream.
+"""
+import base64
+import hmac
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+SALT = 'api.signedurls'
+STREAM_SALT = 'api.signedurls.stream'
+
+# Query parameters carrying the signature
+PARAMS = ('u', 'exp', 'sig')
+
+def _digest(salt, message):
+    digest = salted_hmac(salt, message, algorithm='sha256').digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+def _signature(paperwork_id, version_no, file_type, user_id, expires):
+    return _digest(SALT, f'{paperwork_id}:{version_no}:{file_type}:{user_id}:{expires}')
+
+def _stream_signature(user_id, expires):
+    return _digest(STREAM_SALT, f'{user_id}:{expires}')
+
+def expiry(now=None):
+    ttl = settings.SIGNED_URL_TTL
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+def sign(paperwork_id, version_no, file_type, user_id, expires=None):
+    """Query parameters granting ``user_id`` access to one file of a version."""
+    expires = expiry() if expires is None else expires
+    return {
+        'u': str(user_id),
+        'exp': str(expires),
+        'sig': _signature(paperwork_id, version_no, file_type, user_id, expires),
+    }
+
+def verify(params, paperwork_id, version_no, file_type):
+    """
+    The expiry of the signed URL in ``params`` (a QueryDict) if it grants
+    access to this file, otherwise None.
+    """
+    checked = _checked(params, lambda user_id, expires: _signature(
+        paperwork_id, version_no, file_type, user_id, expires))
+    return checked[1] if checked else None
+
+def sign_stream(user_id, expires=None):
+    """Query parameters letting ``user_id`` open their notification stream."""
+    expires = int(time.time()) + settings.NOTIFICATION_STREAM_URL_TTL if expires is None else expires
+    return {
+        'u': str(user_id),
+        'exp': str(expires),
+        'sig': _stream_signature(user_id, expires),
+    }
+
+def verify_stream(params):
+    """The id of the user the stream URL in ``params`` (a mapping) was signed for, or None."""
+    checked = _checked(params, _stream_signature)
+    return checked[0] if checked else None
+
+def _checked(params, signature):
+    """``(user id, expiry)`` of unexpired ``params`` whose signature matches ``signature(user_id, expires)``."""
+    user_id, expires, given = (params.get(name) for name in PARAMS)
+    if not (user_id and expires and given) or not expires.isdigit():
+        return None
+    expires = int(expires)
+    if expires <= time.time():
+        return None
+    return (user_id, expires) if hmac.compare_digest(signature(user_id, expires), given) else None
+
+def cache_control(expires):
+    """Cache-Control for a response to a signed URL valid until ``expires``."""
+    return f'public, max-age={max(expires - int(time.time()), 0)}'
+
+def query_string(params):
+    """The signature parameters of ``params``, to pass them on to a related URL of the same scope."""
+    return urlencode({name: params[name] for name in PARAMS if name in params})
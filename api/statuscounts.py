@@ -0,0 +1,80 @@
+"""
+Paperwork counts per status for the dashboards.
+
+By default the counts are computed with one conditional-aggregate query.
+With ``PAPERWORK_STATUS_COUNTS`` on they are read from StatusCount rows, one
+per researcher and status plus one per status for all papers, which every
+status change adjusts inside its own transaction. ``manage.py
+rebuild_status_counts`` recomputes the rows from the paperworks.
+"""
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, Q
+
+from admin_app.models import PaperWork
+from .models import StatusCount
+
+STATUSES = [choice for choice, _ in PaperWork.STATUS_CHOICES]
+
+def aggregate(queryset):
+    """``{'total': n, <status>: n, ...}`` for ``queryset`` in a single query."""
+    return queryset.aggregate(
+        total=Count('pk'),
+        **{paper_status: Count('pk', filter=Q(status=paper_status)) for paper_status in STATUSES}
+    )
+
+def counts(researcher=None):
+    """Counts per status of ``researcher``'s paperworks, or of all paperworks."""
+    if not settings.PAPERWORK_STATUS_COUNTS:
+        queryset = PaperWork.objects.all()
+        if researcher is not None:
+            queryset = queryset.filter(researcher=researcher)
+        return aggregate(queryset)
+
+    result = dict.fromkeys(STATUSES, 0)
+    result.update(StatusCount.objects.filter(researcher=researcher).values_list('status', 'count'))
+    result['total'] = sum(result[paper_status] for paper_status in STATUSES)
+    return result
+
+def _adjust(researcher_id, paper_status, delta):
+    rows = StatusCount.objects.filter(researcher_id=researcher_id, status=paper_status)
+    if not rows.update(count=F('count') + delta):
+        try:
+            with transaction.atomic():
+                StatusCount.objects.create(researcher_id=researcher_id, status=paper_status, count=delta)
+        except IntegrityError:
+            # Created concurrently by another transition
+            rows.update(count=F('count') + delta)
+
+def record_transition(researcher_id, old_status, new_status):
+    """
+    Account for a paperwork moving from ``old_status`` to ``new_status``.
+
+    ``None`` stands for a paperwork being created or deleted. Must run in
+    the transaction that changes the paperwork, after its row is locked, so
+    ``old_status`` is what other transactions saw last. A no-op unless
+    PAPERWORK_STATUS_COUNTS is on.
+    """
+    if not settings.PAPERWORK_STATUS_COUNTS or old_status == new_status:
+        return
+    for scope in (researcher_id, None):
+        if old_status is not None:
+            _adjust(scope, old_status, -1)
+        if new_status is not None:
+            _adjust(scope, new_status, 1)
+
+def rebuild():
+    """Replace all StatusCount rows with counts taken from the paperworks. Returns the number of rows."""
+    with transaction.atomic():
+        grouped = PaperWork.objects.order_by().values_list('researcher_id', 'status').annotate(count=Count('pk'))
+        rows = []
+        totals = dict.fromkeys(STATUSES, 0)
+        for researcher_id, paper_status, count in grouped:
+            rows.append(StatusCount(researcher_id=researcher_id, status=paper_status, count=count))
+            totals[paper_status] += count
+        rows.extend(StatusCount(researcher=None, status=paper_status, count=count)
+                    for paper_status, count in totals.items())
+
+        StatusCount.objects.all().delete()
+        StatusCount.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
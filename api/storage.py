@@ -0,0 +1,122 @@
+"""
+Media volumes.
+
+Files are addressed by a volume independent path such as
+``blobs/ab/cd/<sha256>``; that is what Version rows store. ``MEDIA_VOLUMES``
+lists the mount points a path may live on and ``locate`` finds it. New
+per-paperwork data is placed on a volume chosen by ``MEDIA_PLACEMENT_POLICY``
+under nested shard folders derived from a hash of the paperwork id, so no
+single directory grows with the number of papers.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+# rel_path -> volume the file was last found on
+_locations = OrderedDict()
+_locations_lock = threading.Lock()
+LOCATION_CACHE_SIZE = 10000
+
+def volumes():
+    """Absolute roots of all media volumes; the first one is MEDIA_ROOT."""
+    return [str(volume) for volume in settings.MEDIA_VOLUMES]
+
+def shard(paperwork_id):
+    """Nested shard folders for a paperwork, e.g. ``3f/a2/<paperwork_id>``."""
+    digest = hashlib.sha256(str(paperwork_id).encode()).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{paperwork_id}"
+
+def choose_volume(paperwork_id):
+    """Volume new files of ``paperwork_id`` are written to."""
+    candidates = volumes()
+    if len(candidates) == 1:
+        return candidates[0]
+    if settings.MEDIA_PLACEMENT_POLICY == 'free_space':
+        return max(candidates, key=lambda volume: shutil.disk_usage(volume).free)
+    # Rendezvous hashing: adding a volume only moves the papers that now rank it first
+    return max(candidates, key=lambda volume: hashlib.sha256(f"{volume}:{paperwork_id}".encode()).digest())
+
+def path_on(volume, rel_path):
+    return os.path.join(volume, rel_path)
+
+def locate(rel_path):
+    """Absolute path of ``rel_path`` on whichever volume holds it, or None."""
+    with _locations_lock:
+        cached = _locations.get(rel_path)
+    candidates = volumes()
+    if cached in candidates:
+        candidates.remove(cached)
+        candidates.insert(0, cached)
+
+    for volume in candidates:
+        full_path = path_on(volume, rel_path)
+        if os.path.exists(full_path):
+            if volume != cached:
+                _remember(rel_path, volume)
+            return full_path
+    return None
+
+def volume_of(full_path):
+    for volume in volumes():
+        if os.path.commonpath([volume, full_path]) == volume:
+            return volume
+    return volumes()[0]
+
+def _remember(rel_path, volume):
+    with _locations_lock:
+        _locations[rel_path] = volume
+        _locations.move_to_end(rel_path)
+        while len(_locations) > LOCATION_CACHE_SIZE:
+            _locations.popitem(last=False)
+
+def remove(rel_path):
+    """Delete ``rel_path`` from every volume."""
+    for volume in volumes():
+        try:
+            os.remove(path_on(volume, rel_path))
+        except FileNotFoundError:
+            pass
+    with _locations_lock:
+        _locations.pop(rel_path, None)
+
+# Suffix of the copy a move renames into place
+MOVING_SUFFIX = '.moving'
+
+def move(rel_path, volume):
+    """
+    Move ``rel_path`` onto ``volume``. Returns whether it was moved.
+
+    The file is copied next to its destination and renamed into place before
+    the source is removed, so readers always find a complete copy. A source
+    deleted meanwhile leaves nothing behind on ``volume``.
+    """
+    source = locate(rel_path)
+    target = path_on(volume, rel_path)
+    if source is None or source == target:
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}{MOVING_SUFFIX}"
+    try:
+        shutil.copyfile(source, tmp_target)
+    except FileNotFoundError:
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        return False
+    os.replace(tmp_target, target)
+    _remember(rel_path, volume)
+    try:
+        os.remove(source)
+    except FileNotFoundError:
+        pass
+    return True
+
+def usage():
+    """Used and total bytes per volume."""
+    result = {}
+    for volume in volumes():
+        disk = shutil.disk_usage(volume)
+        result[volume] = (disk.used, disk.total)
+    return result
@@ -0,0 +1,435 @@
+"""
+Server-sent notification streams.
+
+``GET /api/notifications/stream/`` keeps a ``text/event-stream`` response
+open and pushes an event whenever a notification lands in the user's inbox,
+so clients no longer poll the list. Clients send the access token in the
+Authorization header or, like browsers' EventSource which cannot, open a
+short-lived URL signed for the user by ``/api/notifications/stream-url/``
+(see api/signedurls.py). The path is served by
+NotificationStreamMiddleware in front of the ASGI application (it does not
+exist under runserver's WSGI). Idle streams hold no thread or database
+connection, which is what lets one worker keep thousands of them open.
+
+Each process has one Hub mapping user ids to the queues of their open
+streams. ``inbox.deliver`` publishes the new items once their transaction
+commits, through the broker selected by NOTIFICATION_STREAM_BROKER:
+
+- ``local``: straight to this process's hub (a single worker)
+- ``socket``: a datagram to every worker's Unix socket in
+  NOTIFICATION_STREAM_SOCKET_DIR (workers on one host)
+- ``sqlite``: a row in a shared SQLite file every worker polls
+
+Events are ``notification`` (data as in the notification list), ``unread``
+(the unread count, sent on connect) and ``resync``, sent when a client fell
+so far behind that events were dropped; it should reload the list.
+
+``auth_app.authentication.forget_user`` publishes a user change through the
+same broker: every worker drops the user's cached snapshot and the user's
+open streams end if the user was frozen, deactivated or deleted.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from auth_app.authentication import CachedJWTAuthentication, cached_user, drop_snapshot
+from . import signedurls
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/notifications/stream/'
+
+# Payload of a message saying the user changed, instead of a notification
+USER_CHANGED = None
+
+def item_payload(item):
+    """Stream data of an InboxItem, the same fields the notification list returns."""
+    return {
+        'id': str(item.id),
+        'notification': str(item.notification_id),
+        'event': item.event,
+        'paper': str(item.paper_id),
+        'at': item.at.isoformat().replace('+00:00', 'Z'),
+        'read': item.read,
+        'read_at': None,
+    }
+
+def format_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+class Subscription:
+    """The queue of one open stream, filled from any thread."""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, payload):
+        """Queue ``payload``; call it on the subscription's loop."""
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            if payload is USER_CHANGED:
+                # Must not be lost, it may end the stream
+                self.queue.get_nowait()
+                self.queue.put_nowait(payload)
+
+class Hub:
+    """Open streams of this process by user id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(str(user_id), settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions[subscription.user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def dispatch(self, messages):
+        """Hand ``[(user_id, payload), ...]`` to the user's open streams in this process."""
+        by_loop = defaultdict(list)
+        for user_id, payload in messages:
+            if payload is USER_CHANGED:
+                # Again here: a worker may have cached the user just before the change committed
+                drop_snapshot(user_id)
+        with self._lock:
+            for user_id, payload in messages:
+                for subscription in self._subscriptions.get(str(user_id), ()):
+                    by_loop[subscription.loop].append((subscription, payload))
+        # One wakeup per event loop rather than per stream
+        for loop, deliveries in by_loop.items():
+            loop.call_soon_threadsafe(_put_all, deliveries)
+
+def _put_all(deliveries):
+    for subscription, payload in deliveries:
+        subscription.put(payload)
+
+class LocalBroker:
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, messages):
+        self.hub.dispatch(messages)
+
+class SocketBroker:
+    """
+    Every listening process binds a datagram socket in the directory and
+    publishers send each message to all of them. Sockets whose process is
+    gone are removed by the first publisher that finds them dead.
+    """
+    # Datagrams stay well below the default socket buffer size
+    MAX_MESSAGES = 100
+
+    def __init__(self, hub, directory=None):
+        self.hub = hub
+        self.directory = directory or settings.NOTIFICATION_STREAM_SOCKET_DIR
+        self.path = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.bind(self.path)
+        threading.Thread(target=self._listen, args=(listener,), daemon=True,
+                         name='notification-stream-socket').start()
+
+    def _listen(self, listener):
+        while True:
+            data = listener.recv(1024 * 1024)
+            try:
+                self.hub.dispatch(json.loads(data))
+            except Exception:
+                logger.exception('Dropped a malformed notification datagram')
+
+    def publish(self, messages):
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A worker that stopped reading must not block the request publishing
+        sender.setblocking(False)
+        try:
+            for start in range(0, len(messages), self.MAX_MESSAGES):
+                data = json.dumps(messages[start:start + self.MAX_MESSAGES]).encode()
+                for path in glob.glob(os.path.join(self.directory, '*.sock')):
+                    try:
+                        sender.sendto(data, path)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        self._remove(path)
+                    except BlockingIOError:
+                        logger.warning('Notification stream socket %s is full, dropped a message', path)
+        finally:
+            sender.close()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class SQLiteBroker:
+    """
+    Messages are rows of a shared SQLite file; every listening process polls
+    for rows newer than the last one it saw. Rows older than KEEP_SECONDS
+    are removed by the publishers.
+    """
+    KEEP_SECONDS = 60
+
+    def __init__(self, hub, path=None, poll_interval=None):
+        self.hub = hub
+        self.path = path or settings.NOTIFICATION_STREAM_SQLITE_PATH
+        self.poll_interval = poll_interval or settings.NOTIFICATION_STREAM_POLL_INTERVAL
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS messages '
+                               '(id INTEGER PRIMARY KEY AUTOINCREMENT, at REAL NOT NULL, body TEXT NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def start(self):
+        last_id = self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+        threading.Thread(target=self._poll, args=(last_id,), daemon=True,
+                         name='notification-stream-sqlite').start()
+
+    def _poll(self, last_id):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = self._connection().execute(
+                    'SELECT id, body FROM messages WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+            except sqlite3.Error:
+                logger.exception('Reading notification stream messages failed')
+                continue
+            for last_id, body in rows:
+                self.hub.dispatch(json.loads(body))
+
+    def publish(self, messages):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('INSERT INTO messages (at, body) VALUES (?, ?)', (now, json.dumps(messages)))
+            connection.execute('DELETE FROM messages WHERE at < ?', (now - self.KEEP_SECONDS,))
+
+BROKERS = {
+    'local': LocalBroker,
+    'socket': SocketBroker,
+    'sqlite': SQLiteBroker,
+}
+
+_hub = Hub()
+_broker = None
+_started = False
+_broker_lock = threading.Lock()
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BROKERS[settings.NOTIFICATION_STREAM_BROKER](_hub)
+        return _broker
+
+def hub():
+    """This process's hub, listening to the broker from the first call on."""
+    global _started
+    current = broker()
+    with _broker_lock:
+        if not _started:
+            current.start()
+            _started = True
+    return _hub
+
+def publish(items):
+    """Push new InboxItems to their recipients' streams in every worker."""
+    messages = [(str(item.recipient_id), item_payload(item)) for item in items]
+    if not messages:
+        return
+    try:
+        broker().publish(messages)
+    except Exception:
+        # Clients still see the items on their next list request
+        logger.exception('Publishing %d notifications to the streams failed', len(messages))
+
+def publish_user_change(user_id):
+    """Have every worker drop ``user_id``'s snapshot and re-check the user's open streams."""
+    try:
+        broker().publish([(str(user_id), USER_CHANGED)])
+    except Exception:
+        # The snapshot still expires after AUTH_USER_CACHE_SECONDS
+        logger.exception('Publishing a change of user %s to the streams failed', user_id)
+
+def _cors_headers(origin):
+    """The CORS headers corsheaders would add; the stream is answered before Django's middleware."""
+    if not origin or not (settings.CORS_ALLOW_ALL_ORIGINS or origin in settings.CORS_ALLOWED_ORIGINS):
+        return []
+    headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'origin')]
+    if settings.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-credentials', b'true'))
+    return headers
+
+def _open_stream(raw_token, signed_user_id):
+    """``(status, user, unread count)`` for the access token or signed URL of a stream request."""
+    # inbox imports this module to publish
+    from . import inbox
+
+    authentication = CachedJWTAuthentication()
+    try:
+        if raw_token is not None:
+            user = authentication.get_user(authentication.get_validated_token(raw_token))
+        elif signed_user_id is not None:
+            user = cached_user(signed_user_id)
+            if user is None or not user.is_active:
+                return 401, None, None
+        else:
+            return 401, None, None
+        if user.status == 'FROZEN':
+            return 403, None, None
+        return 200, user, inbox.unread_count(user)
+    except (InvalidToken, AuthenticationFailed):
+        return 401, None, None
+    finally:
+        close_old_connections()
+
+def _may_keep_streaming(user_id):
+    """Whether ``user_id`` may still hold streams open after a change to the user."""
+    try:
+        user = cached_user(user_id)
+        return user is not None and user.is_active and user.status != 'FROZEN'
+    finally:
+        close_old_connections()
+
+def _raw_token(scope):
+    """Access token from the Authorization header."""
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            return CachedJWTAuthentication().get_raw_token(value)
+    return None
+
+def _signed_user_id(scope):
+    """Id of the user a signed stream URL was issued to, None without a valid signature."""
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return signedurls.verify_stream({name: values[0] for name, values in params.items()})
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _send_json(send, status, data, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+async def serve(scope, receive, send):
+    """Answer a stream request: the unread count, then the user's notifications as they arrive."""
+    origin = dict(scope.get('headers', [])).get(b'origin', b'').decode('latin-1')
+    cors = _cors_headers(origin)
+    if scope['method'] != 'GET':
+        return await _send_json(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'}, cors)
+
+    # Off the request's own thread: Django keeps that alive until the response ends
+    status, user, unread_count = await sync_to_async(_open_stream, thread_sensitive=False)(_raw_token(scope), _signed_user_id(scope))
+    if status != 200:
+        detail = ('Authentication credentials were not provided or are invalid.' if status == 401
+                  else 'You do not have permission to perform this action.')
+        return await _send_json(send, status, {'detail': detail}, cors)
+
+    subscription = hub().subscribe(user.pk)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # Tell nginx not to buffer the events
+            (b'x-accel-buffering', b'no'),
+            *cors,
+        ]})
+        first = 'retry: 5000\n\n' + format_event('unread', {'unread_count': unread_count})
+        await send({'type': 'http.response.body', 'body': first.encode(), 'more_body': True})
+
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=settings.NOTIFICATION_STREAM_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            getter.cancel()
+            if disconnected in done:
+                return
+            if getter.done() and not getter.cancelled():
+                payload = getter.result()
+                if payload is USER_CHANGED:
+                    if not await sync_to_async(_may_keep_streaming, thread_sensitive=False)(user.pk):
+                        # EventSource reconnects and is refused with 403
+                        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                        return
+                    body = ''
+                else:
+                    body = format_event('notification', payload, event_id=payload.get('id'))
+                if subscription.overflowed and subscription.queue.empty():
+                    subscription.overflowed = False
+                    body += format_event('resync', {})
+            else:
+                body = ': keepalive\n\n'
+            if body:
+                await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        hub().unsubscribe(subscription)
+
+class NotificationStreamMiddleware:
+    """
+    ASGI middleware answering STREAM_PATH itself.
+
+    Behind Django's handler every open stream would keep a thread and run
+    the whole middleware stack; here an idle stream is a coroutine and a
+    queue. Authentication is the same JWT the API uses, or a signed URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            return await serve(scope, receive, send)
+        return await self.app(scope, receive, send)
@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from admin_app.models import PaperWork
+from .models import Version, Notification
+from . import blobstore, inbox, retention, statuscounts, versionstats, zipindex
+
+class SessionNotOpen(Exception):
+    pass
+
+def allocate_version_no(paperwork):
+    """
+    Take the next version number from the paperwork's counter.
+
+    The counter is bumped with a single UPDATE, so concurrent submissions
+    serialize on the paperwork row and never see the same number. Papers
+    created before the counter existed start from their highest version.
+    """
+    highest = Version.objects.filter(paperwork=OuterRef('pk')).order_by('-version_no').values('version_no')[:1]
+    PaperWork.objects.filter(pk=paperwork.pk).update(
+        latest_version_no=Greatest(F('latest_version_no'), Coalesce(Subquery(highest), 0)) + 1
+    )
+    paperwork.latest_version_no = PaperWork.objects.values_list('latest_version_no', flat=True).get(pk=paperwork.pk)
+    return paperwork.latest_version_no
+
+def submit_version(paperwork, staged, ai_percent_self=0.0, session=None, admin_ids=None):
+    """
+    Create a version from staged files as one transaction.
+
+    ``staged`` maps the Version path fields (pdf_path, latex_path,
+    python_path, docx_path) to ``blobstore.StagedFile`` objects. The files are
+    moved into the blob store only if the transaction commits. When
+    ``session`` is given the upload session is marked committed in the same
+    transaction. ``admin_ids`` limits the admins notified, see
+    ``inbox.deliver``.
+    """
+    try:
+        with transaction.atomic(durable=True):
+            version_no = allocate_version_no(paperwork)
+            # The counter update holds the row lock, so this is the status being replaced
+            previous_status = PaperWork.objects.values_list('status', flat=True).get(pk=paperwork.pk)
+
+            if session is not None:
+                if not type(session).objects.filter(id=session.id, status='OPEN').update(
+                        status='COMMITTED', version_no=version_no):
+                    raise SessionNotOpen('Upload session is no longer open')
+                session.status = 'COMMITTED'
+                session.version_no = version_no
+
+            paths = {field: blobstore.add_reference(staged_file) for field, staged_file in staged.items()}
+            version = Version.objects.create(
+                paperwork=paperwork,
+                version_no=version_no,
+                pdf_path=paths.get('pdf_path'),
+                latex_path=paths.get('latex_path'),
+                python_path=paths.get('python_path'),
+                docx_path=paths.get('docx_path'),
+                ai_percent_self=ai_percent_self
+            )
+            versionstats.record_submission(paperwork, version)
+
+            # Update paperwork status
+            paperwork.status = 'SUBMITTED'
+            paperwork.save(update_fields=['status', 'updated_at'])
+            statuscounts.record_transition(paperwork.researcher_id, previous_status, paperwork.status)
+
+            # Create notification for new version
+            notification = Notification.objects.create(
+                event='SUBMITTED',
+                paper=paperwork
+            )
+            inbox.deliver([notification], admin_ids=admin_ids)
+
+            # Index the code ZIP once it has been published
+            transaction.on_commit(lambda: zipindex.prebuild(version.python_path))
+
+            # Old versions are pruned outside the request
+            transaction.on_commit(retention.schedule)
+    finally:
+        # Published files have left staging, anything still there was rolled back
+        for staged_file in staged.values():
+            blobstore.discard(staged_file)
+
+    return version
@@ -0,0 +1,69 @@
+from rest_framework.test import APITestCase
+
+from auth_app.models import User
+from admin_app.models import PaperWork
+from .models import Version, Notification
+from . import inbox
+
+class ListQueryCountTests(APITestCase):
+    """
+    A page of a list endpoint costs the same number of queries however many
+    rows it holds and whichever related objects are expanded.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', email='admin@example.com', role='ADMIN')
+        cls.researcher = User.objects.create(username='researcher', email='researcher@example.com',
+                                             role='RESEARCHER')
+        other = User.objects.create(username='other', email='other@example.com', role='RESEARCHER')
+        notifications = []
+        for owner in (cls.researcher, other):
+            for i in range(3):
+                paperwork = PaperWork.objects.create(title=f'Paper {i}', researcher=owner, status='SUBMITTED',
+                                                     latest_version_no=3, version_count=3)
+                for version_no in range(1, 4):
+                    Version.objects.create(paperwork=paperwork, version_no=version_no,
+                                           pdf_path=f'test/{paperwork.id}/{version_no}.pdf')
+                    notifications.append(Notification.objects.create(event='SUBMITTED', paper=paperwork))
+        inbox.deliver(notifications)
+        cls.paperwork = PaperWork.objects.filter(researcher=cls.researcher).first()
+
+    def assertListQueries(self, user, url, num, rows):
+        self.client.force_authenticate(user=user)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), rows)
+        return results
+
+    def test_paperworks_list(self):
+        results = self.assertListQueries(self.admin, '/api/paperworks/', 1, 6)
+        self.assertIsInstance(results[0]['researcher'], str)
+        self.assertListQueries(self.researcher, '/api/paperworks/', 1, 3)
+
+    def test_paperworks_list_expanded(self):
+        results = self.assertListQueries(self.admin, '/api/paperworks/?expand=researcher', 1, 6)
+        self.assertIn('username', results[0]['researcher'])
+
+    def test_versions_list(self):
+        url = f'/api/paperworks/{self.paperwork.id}/versions/'
+        results = self.assertListQueries(self.researcher, url, 2, 3)
+        self.assertEqual(results[0]['paperwork'], str(self.paperwork.id))
+
+    def test_versions_list_expanded(self):
+        url = f'/api/paperworks/{self.paperwork.id}/versions/?expand=paperwork.researcher'
+        results = self.assertListQueries(self.researcher, url, 2, 3)
+        self.assertEqual(results[0]['paperwork']['researcher']['username'], 'researcher')
+
+    def test_notifications_list(self):
+        results = self.assertListQueries(self.admin, '/api/notifications/', 1, 18)
+        self.assertIsInstance(results[0]['paper'], str)
+        self.assertListQueries(self.researcher, '/api/notifications/?unread=true', 1, 9)
+
+    def test_notifications_list_expanded(self):
+        results = self.assertListQueries(self.admin, '/api/notifications/?expand=paper', 1, 18)
+        self.assertIn('title', results[0]['paper'])
+        results = self.assertListQueries(self.admin, '/api/notifications/?expand=paper.researcher', 1, 18)
+        self.assertIn('username', results[0]['paper']['researcher'])
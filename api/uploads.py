@@ -0,0 +1,149 @@
+"""
+Helpers for resumable upload sessions.
+
+Every part of a session is appended to a staging file under
+``UPLOAD_STAGING_PATH/<paperwork shard>/<session_id>/`` on the volume chosen
+for the paperwork, so committing a session moves the finished parts into the
+blob store on that volume with a rename instead of another copy. The version
+number is allocated on commit.
+
+Sessions left OPEN for UPLOAD_SESSION_TTL_HOURS after their last chunk are
+aborted and their staging folders removed by ``manage.py
+expire_upload_sessions``.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UploadSession
+from . import blobstore, storage
+
+# Upload field -> Version path field
+UPLOAD_FIELDS = {
+    'paper_pdf': 'pdf_path',
+    'latex_tex': 'latex_path',
+    'python_zip': 'python_path',
+    'docx_file': 'docx_path',
+}
+REQUIRED_FIELDS = ('paper_pdf', 'latex_tex', 'python_zip')
+
+CHUNK_SIZE = 64 * 1024
+
+class UploadError(Exception):
+    pass
+
+class ChecksumMismatch(UploadError):
+    pass
+
+class PartBusy(UploadError):
+    pass
+
+def session_folder(session):
+    return f"{settings.UPLOAD_STAGING_PATH}/{storage.shard(session.paperwork_id)}/{session.id}"
+
+def part_path(session, field):
+    return f"{session_folder(session)}/{field}"
+
+def full_path(rel_path):
+    return storage.locate(rel_path) or storage.path_on(storage.volumes()[0], rel_path)
+
+def prepare_part(rel_path, volume=None):
+    """Create the staging folder and an empty file for a new part."""
+    path = storage.path_on(volume, rel_path) if volume else full_path(rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+@contextmanager
+def locked_part(part):
+    """
+    Open the staging file of ``part`` under an exclusive lock and re-read
+    ``part.offset`` while holding it.
+
+    The lock is held until the block ends, so checking the offset, writing
+    the chunk and recording the new offset happen as one step for requests
+    in any process. A second request for the same part gets PartBusy
+    instead of waiting behind a slow upload.
+    """
+    with open(full_path(part.path), 'r+b') as destination:
+        try:
+            fcntl.flock(destination, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise PartBusy('Another request is uploading this file') from None
+        part.refresh_from_db(fields=['offset'])
+        yield destination
+
+def write_chunk(part, destination, stream, length, checksum=None):
+    """
+    Append ``length`` bytes from ``stream`` to ``part`` at its current offset.
+
+    ``destination`` is the file opened by ``locked_part``. Anything past the
+    recorded offset (left over from an interrupted request) is discarded
+    first. When ``checksum`` (hex SHA-256 of the chunk) is given and does not
+    match, the chunk is rolled back. Returns the new offset.
+    """
+    if part.offset + length > part.size:
+        raise UploadError('Chunk exceeds the declared file size')
+
+    digest = hashlib.sha256()
+    written = 0
+    destination.truncate(part.offset)
+    destination.seek(part.offset)
+    while written < length:
+        chunk = stream.read(min(CHUNK_SIZE, length - written))
+        if not chunk:
+            break
+        digest.update(chunk)
+        destination.write(chunk)
+        written += len(chunk)
+
+    if written != length or (checksum and digest.hexdigest() != checksum.lower()):
+        destination.truncate(part.offset)
+        if written != length:
+            raise UploadError('Incomplete chunk body')
+        raise ChecksumMismatch('Chunk checksum mismatch')
+    destination.flush()
+
+    return part.offset + written
+
+def file_sha256(rel_path):
+    digest = hashlib.sha256()
+    with open(full_path(rel_path), 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def staged_session_files(parts):
+    """Staged files of the verified parts, keyed by Version path field."""
+    return {
+        UPLOAD_FIELDS[part.field]: blobstore.StagedFile(full_path(part.path), part.sha256, part.size)
+        for part in parts
+    }
+
+def discard_session_files(session):
+    for volume in storage.volumes():
+        shutil.rmtree(storage.path_on(volume, session_folder(session)), ignore_errors=True)
+
+def touch_session(session):
+    """Record activity on ``session`` so it does not expire while chunks keep arriving."""
+    UploadSession.objects.filter(id=session.id).update(updated_at=timezone.now())
+
+def expire_sessions(ttl_hours=None):
+    """
+    Abort OPEN sessions idle for longer than ``ttl_hours`` (default
+    UPLOAD_SESSION_TTL_HOURS) and delete their staging folders. Returns the
+    number of sessions aborted.
+    """
+    ttl_hours = settings.UPLOAD_SESSION_TTL_HOURS if ttl_hours is None else ttl_hours
+    cutoff = timezone.now() - timedelta(hours=ttl_hours)
+    expired = 0
+    for session in UploadSession.objects.filter(status='OPEN', updated_at__lt=cutoff).only('id', 'paperwork_id'):
+        # Skip sessions committed, aborted or resumed since they were selected
+        if UploadSession.objects.filter(id=session.id, status='OPEN', updated_at__lt=cutoff).update(status='ABORTED'):
+            discard_session_files(session)
+            expired += 1
+    return expired
@@ -5,13 +5,22 @@ urlpatterns = [
     path('paperworks/', views.paperworks_list, name='paperworks_list'),
     path('paperworks/<uuid:id>/', views.paperwork_detail, name='paperwork_detail'),
     path('paperworks/<uuid:id>/versions/', views.versions_list, name='versions_list'),
+    path('paperworks/<uuid:id>/uploads/', views.upload_session_create, name='upload_session_create'),
+    path('uploads/<uuid:session_id>/', views.upload_session_detail, name='upload_session_detail'),
+    path('uploads/<uuid:session_id>/commit/', views.upload_session_commit, name='upload_session_commit'),
+    path('uploads/<uuid:session_id>/<str:field>/', views.upload_session_part, name='upload_session_part'),
     path('paperworks/<uuid:id>/versions/<int:ver>/', views.version_detail, name='version_detail'),
+    path('paperworks/<uuid:id>/versions/<int:ver>/file-urls/', views.version_file_urls, name='version_file_urls'),
     path('paperworks/<uuid:id>/review/', views.review_paperwork, name='review_paperwork'),
     path('paperworks/<uuid:id>/reviews/', views.paperwork_reviews, name='paperwork_reviews'),
     path('paperworks/<uuid:id>/delete/', views.delete_paperwork, name='delete_paperwork'),
     path('reports/summary/', views.reports_summary, name='reports_summary'),
     path('reports/export.csv/', views.reports_export, name='reports_export'),
     path('notifications/', views.notifications_list, name='notifications_list'),
+    path('notifications/unread-count/', views.notifications_unread_count, name='notifications_unread_count'),
+    path('notifications/stream-url/', views.notifications_stream_url, name='notifications_stream_url'),
+    path('notifications/read/', views.notifications_mark_read, name='notifications_mark_read'),
+    path('notifications/read-all/', views.notifications_mark_all_read, name='notifications_mark_all_read'),
     path('stats/researcher/', views.researcher_stats, name='researcher_stats'),
     path('stats/admin/', views.admin_stats, name='admin_stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Denormalized version fields on PaperWork.
+
+``version_count``, ``latest_submitted_at`` and the latest AI percentages are
+kept on the paperwork row so lists, dashboards and the report export never
+have to look at the Version table. ``latest_version_no`` is the version
+counter from ``submissions.allocate_version_no``; it only ever grows, so
+numbers of pruned versions are not handed out again.
+
+Submissions bump the fields in the transaction that creates the version and
+pruning recomputes them for the papers it touched, again inside its own
+transaction. ``manage.py backfill_version_stats`` recomputes them for
+existing data.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from admin_app.models import PaperWork
+from .models import Version
+
+def record_submission(paperwork, version):
+    """Account for a newly created version. Must run in the transaction that created it."""
+    latest = {
+        'latest_submitted_at': version.submitted_at,
+        'latest_ai_percent_self': version.ai_percent_self,
+        'latest_ai_percent_verified': version.ai_percent_verified,
+    }
+    PaperWork.objects.filter(pk=paperwork.pk).update(version_count=F('version_count') + 1, **latest)
+    paperwork.version_count += 1
+    for field, value in latest.items():
+        setattr(paperwork, field, value)
+
+def refresh(paperwork_ids=None):
+    """
+    Recompute the fields from the Version table with a single UPDATE.
+
+    Only ``paperwork_ids`` are refreshed when given, every paperwork
+    otherwise. Returns the number of paperworks updated.
+    """
+    versions = Version.objects.filter(paperwork=OuterRef('pk'))
+    latest = versions.order_by('-version_no')
+    count = versions.order_by().values('paperwork').annotate(count=Count('*')).values('count')
+
+    queryset = PaperWork.objects.all()
+    if paperwork_ids is not None:
+        queryset = queryset.filter(pk__in=list(paperwork_ids))
+    return queryset.update(
+        version_count=Coalesce(Subquery(count), 0),
+        latest_version_no=Greatest(F('latest_version_no'), Coalesce(Subquery(latest.values('version_no')[:1]), 0)),
+        latest_submitted_at=Subquery(latest.values('submitted_at')[:1]),
+        latest_ai_percent_self=Subquery(latest.values('ai_percent_self')[:1]),
+        latest_ai_percent_verified=Subquery(latest.values('ai_percent_verified')[:1]),
+    )
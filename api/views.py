@@ -5,24 +5,35 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from auth_app.utils import IsAdmin, IsNotFrozen
-from django.db.models import Count, Avg
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.urls import reverse
+from datetime import datetime, timezone
+from urllib.parse import urlencode
 from django.conf import settings
-import csv
-import os
 
 from auth_app.models import User
 from admin_app.models import PaperWork
-from .models import Version, Notification, Review
+from .models import Version, Notification, InboxItem, Review, UploadSession, UploadPart
 from .serializers import (
-    VersionSerializer, VersionCreateSerializer, NotificationSerializer,
+    VersionSerializer, VersionCreateSerializer, InboxItemSerializer, MarkReadSerializer,
     ReviewSerializer, ReportSummarySerializer, ResearcherStatsSerializer,
-    AdminStatsSerializer, ReviewModelSerializer
+    AdminStatsSerializer, ReviewModelSerializer, UploadSessionSerializer,
+    UploadSessionCreateSerializer
 )
+from .submissions import submit_version, SessionNotOpen
+from .uploads import (
+    UploadError, PartBusy, part_path, prepare_part, locked_part, write_chunk, file_sha256,
+    staged_session_files, discard_session_files, touch_session
+)
+from . import blobstore, delivery, expansion, inbox, pagination, replicas, reports, retention, signedurls, statuscounts, storage, streams
+from .replicas import replica_read
 from admin_app.serializers import PaperWorkSerializer
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
 def paperworks_list(request):
     # Researchers can only see their own paperworks
     if request.user.role == 'RESEARCHER':
@@ -30,45 +41,54 @@ def paperworks_list(request):
     else:
         paperworks = PaperWork.objects.all()
     
-    serializer = PaperWorkSerializer(paperworks, many=True)
-    return Response(serializer.data)
+    paperworks = expansion.expand_queryset(paperworks, PaperWorkSerializer, request)
+    try:
+        paperworks, page = pagination.paginate(request, paperworks, ('-assigned_at', '-id'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = PaperWorkSerializer(paperworks, many=True, context={'request': request})
+    return Response({'results': serializer.data, **page})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
 def paperwork_detail(request, id):
-    paperwork = get_object_or_404(PaperWork, id=id)
+    paperwork = get_object_or_404(
+        expansion.expand_queryset(PaperWork.objects.all(), PaperWorkSerializer, request), id=id
+    )
     
     # Researchers can only see their own paperworks
-    if request.user.role == 'RESEARCHER' and paperwork.researcher != request.user:
+    if request.user.role == 'RESEARCHER' and paperwork.researcher_id != request.user.id:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    serializer = PaperWorkSerializer(paperwork)
+    serializer = PaperWorkSerializer(paperwork, context={'request': request})
     return Response(serializer.data)
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
 @csrf_exempt
+@replica_read
 def versions_list(request, id):
     paperwork = get_object_or_404(PaperWork, id=id)
     
     # Researchers can only access their own paperworks
-    if request.user.role == 'RESEARCHER' and paperwork.researcher != request.user:
+    if request.user.role == 'RESEARCHER' and paperwork.researcher_id != request.user.id:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
     if request.method == 'GET':
-        versions = Version.objects.filter(paperwork=paperwork)
-        serializer = VersionSerializer(versions, many=True)
-        return Response(serializer.data)
+        versions = expansion.expand_queryset(Version.objects.filter(paperwork=paperwork), VersionSerializer, request)
+        try:
+            versions, page = pagination.paginate(request, versions, ('-version_no',))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = VersionSerializer(versions, many=True, context={'request': request})
+        return Response({'results': serializer.data, **page})
     
     elif request.method == 'POST':
         # Only researchers can submit versions
         if request.user.role != 'RESEARCHER' or paperwork.researcher != request.user:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get the latest version number for this paperwork
-        latest_version = Version.objects.filter(paperwork=paperwork).order_by('-version_no').first()
-        next_version_no = 1 if not latest_version else latest_version.version_no + 1
-        
         # Process the uploaded files
         serializer = VersionCreateSerializer(data=request.data)
         if serializer.is_valid():
@@ -78,117 +98,191 @@ def versions_list(request, id):
             python_zip = request.FILES.get('python_zip')
             docx_file = request.FILES.get('docx_file')
             
-            # Create file paths
-            paper_id = str(paperwork.id)
-            version_str = f"v{next_version_no}"
-            
             # Check if required files are provided
             if not paper_pdf or not latex_tex or not python_zip:
                 return Response({'error': 'PDF, LaTeX, and Python ZIP files are required'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Save files to media storage
-            pdf_path = None
-            latex_path = None
-            python_path = None
-            docx_path = None
-            
-            # Create directory structures if they don't exist
-            pdf_folder = os.path.join(settings.PDF_STORAGE_PATH, paper_id, version_str)
-            latex_folder = os.path.join(settings.LATEX_STORAGE_PATH, paper_id, version_str)
-            python_folder = os.path.join(settings.PYTHON_STORAGE_PATH, paper_id, version_str)
-            docx_folder = os.path.join(settings.DOCX_STORAGE_PATH, paper_id, version_str)
-            
-            # Ensure all directories exist
-            for folder in [pdf_folder, latex_folder, python_folder, docx_folder]:
-                full_path = os.path.join(settings.MEDIA_ROOT, folder)
-                os.makedirs(full_path, exist_ok=True)
+            # Stage files while hashing them, they are moved into the blob store on commit
+            staged = {}
+            volume = storage.choose_volume(paperwork.id)
+            try:
+                for field, upload in [('pdf_path', paper_pdf), ('latex_path', latex_tex),
+                                      ('python_path', python_zip), ('docx_path', docx_file)]:
+                    if upload:
+                        staged[field] = blobstore.stage_chunks(upload.chunks(), volume)
+            except Exception:
+                for staged_file in staged.values():
+                    blobstore.discard(staged_file)
+                raise
             
-            if paper_pdf:
-                pdf_path = f"{pdf_folder}/paper.pdf"
-                full_pdf_path = os.path.join(settings.MEDIA_ROOT, pdf_path)
-                with open(full_pdf_path, 'wb+') as destination:
-                    for chunk in paper_pdf.chunks():
-                        destination.write(chunk)
-            
-            if latex_tex:
-                latex_path = f"{latex_folder}/latex.tex"
-                full_latex_path = os.path.join(settings.MEDIA_ROOT, latex_path)
-                with open(full_latex_path, 'wb+') as destination:
-                    for chunk in latex_tex.chunks():
-                        destination.write(chunk)
-            
-            if python_zip:
-                python_path = f"{python_folder}/code.zip"
-                full_python_path = os.path.join(settings.MEDIA_ROOT, python_path)
-                with open(full_python_path, 'wb+') as destination:
-                    for chunk in python_zip.chunks():
-                        destination.write(chunk)
-            
-            if docx_file:
-                docx_path = f"{docx_folder}/paper.docx"
-                full_docx_path = os.path.join(settings.MEDIA_ROOT, docx_path)
-                with open(full_docx_path, 'wb+') as destination:
-                    for chunk in docx_file.chunks():
-                        destination.write(chunk)
-            
-            # Create version with file paths
-            version = Version.objects.create(
-                paperwork=paperwork,
-                version_no=next_version_no,
-                pdf_path=pdf_path,
-                latex_path=latex_path,
-                python_path=python_path,
-                docx_path=docx_path,
+            # Allocate the version number and record everything in one transaction
+            version = submit_version(
+                paperwork,
+                staged,
                 ai_percent_self=serializer.validated_data.get('ai_percent_self', 0.0)
             )
             
-            # Update paperwork status
-            paperwork.status = 'SUBMITTED'
-            paperwork.save()
+            return Response(VersionSerializer(version, context={'request': request}).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+def _get_owned_session(request, session_id):
+    session = get_object_or_404(UploadSession.objects.select_related('paperwork'), id=session_id)
+    if request.user.role != 'RESEARCHER' or session.paperwork.researcher_id != request.user.id:
+        return None
+    return session
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def upload_session_create(request, id):
+    paperwork = get_object_or_404(PaperWork, id=id)
+    
+    # Only the assigned researcher can upload versions
+    if request.user.role != 'RESEARCHER' or paperwork.researcher != request.user:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = UploadSessionCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    session = UploadSession.objects.create(
+        paperwork=paperwork,
+        ai_percent_self=serializer.validated_data['ai_percent_self']
+    )
+    
+    # Parts are staged on the paperwork's volume until the session is committed
+    volume = storage.choose_volume(paperwork.id)
+    for field, spec in serializer.validated_data['files'].items():
+        rel_path = part_path(session, field)
+        prepare_part(rel_path, volume)
+        UploadPart.objects.create(
+            session=session,
+            field=field,
+            size=spec['size'],
+            sha256=spec['sha256'].lower(),
+            path=rel_path
+        )
+    
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def upload_session_detail(request, session_id):
+    session = _get_owned_session(request, session_id)
+    if session is None:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'GET':
+        return Response(UploadSessionSerializer(session).data)
+    
+    # Abort the session and drop whatever was uploaded so far
+    if session.status != 'OPEN':
+        return Response({'error': f'Upload session is {session.status.lower()}'}, status=status.HTTP_409_CONFLICT)
+    discard_session_files(session)
+    session.status = 'ABORTED'
+    session.save()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def upload_session_part(request, session_id, field):
+    """
+    Append a chunk to one file of an upload session.
+
+    The raw request body is the chunk. ``Upload-Offset`` must equal the offset
+    the server has stored for the part; ``Upload-Checksum`` optionally carries
+    the hex SHA-256 of the chunk.
+    """
+    session = _get_owned_session(request, session_id)
+    if session is None:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    if session.status != 'OPEN':
+        return Response({'error': f'Upload session is {session.status.lower()}'}, status=status.HTTP_409_CONFLICT)
+    
+    part = get_object_or_404(UploadPart, session=session, field=field)
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        return Response({'error': 'Upload-Offset and Content-Length headers are required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    def offset_error(message, response_status):
+        response = Response({'error': message, 'offset': part.offset}, status=response_status)
+        response['Upload-Offset'] = str(part.offset)
+        return response
+    
+    # One request per part at a time, from the offset check to the recorded new offset
+    try:
+        with locked_part(part) as destination:
+            # Tell the client where to resume from
+            if offset != part.offset:
+                return offset_error('Offset mismatch', status.HTTP_409_CONFLICT)
             
-            # Check if there are more than 5 versions and delete the oldest ones
-            versions = Version.objects.filter(paperwork=paperwork).order_by('-version_no')
-            if versions.count() > 5:
-                # Get versions to delete (all except the 5 most recent)
-                versions_to_delete = versions[5:]
-                
-                for old_version in versions_to_delete:
-                    # Delete files associated with this version
-                    if old_version.pdf_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, old_version.pdf_path)):
-                        os.remove(os.path.join(settings.MEDIA_ROOT, old_version.pdf_path))
-                    
-                    if old_version.latex_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, old_version.latex_path)):
-                        os.remove(os.path.join(settings.MEDIA_ROOT, old_version.latex_path))
-                    
-                    if old_version.python_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, old_version.python_path)):
-                        os.remove(os.path.join(settings.MEDIA_ROOT, old_version.python_path))
-                    
-                    if old_version.docx_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, old_version.docx_path)):
-                        os.remove(os.path.join(settings.MEDIA_ROOT, old_version.docx_path))
-                    
-                    # Delete the version record
-                    old_version.delete()
+            try:
+                new_offset = write_chunk(part, destination, request.stream, length,
+                                         request.headers.get('Upload-Checksum'))
+            except UploadError as e:
+                return offset_error(str(e), status.HTTP_400_BAD_REQUEST)
             
-            # Create notification for new version
-            Notification.objects.create(
-                event='SUBMITTED',
-                paper=paperwork
-            )
+            # Only a reset of the part can have moved the offset, leave the file to it
+            if not UploadPart.objects.filter(id=part.id, offset=part.offset).update(offset=new_offset):
+                part.refresh_from_db(fields=['offset'])
+                return offset_error('Offset mismatch', status.HTTP_409_CONFLICT)
+            part.offset = new_offset
+            touch_session(session)
             
-            return Response(VersionSerializer(version).data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # Verify the whole file once its last byte arrived
+            if part.is_complete and file_sha256(part.path) != part.sha256:
+                UploadPart.objects.filter(id=part.id).update(offset=0)
+                destination.truncate(0)
+                return Response({'error': 'File checksum mismatch, upload the file again', 'offset': 0},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except PartBusy as e:
+        return offset_error(str(e), status.HTTP_409_CONFLICT)
+    
+    response = Response({'field': part.field, 'offset': part.offset, 'size': part.size, 'complete': part.is_complete})
+    response['Upload-Offset'] = str(part.offset)
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def upload_session_commit(request, session_id):
+    session = _get_owned_session(request, session_id)
+    if session is None:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    if session.status != 'OPEN':
+        return Response({'error': f'Upload session is {session.status.lower()}'}, status=status.HTTP_409_CONFLICT)
+    
+    parts = list(session.parts.all())
+    incomplete = [part.field for part in parts if not part.is_complete]
+    if incomplete:
+        return Response({'error': 'Upload incomplete', 'incomplete': incomplete}, status=status.HTTP_409_CONFLICT)
+    
+    try:
+        version = submit_version(session.paperwork, staged_session_files(parts),
+                                 ai_percent_self=session.ai_percent_self, session=session)
+    except SessionNotOpen as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    discard_session_files(session)
+    
+    return Response(VersionSerializer(version, context={'request': request}).data, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
 def version_detail(request, id, ver):
     paperwork = get_object_or_404(PaperWork, id=id)
     
     # Researchers can only access their own paperworks
-    if request.user.role == 'RESEARCHER' and paperwork.researcher != request.user:
+    if request.user.role == 'RESEARCHER' and paperwork.researcher_id != request.user.id:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
     version = get_object_or_404(Version, paperwork=paperwork, version_no=ver)
-    serializer = VersionSerializer(version)
+    serializer = VersionSerializer(version, context={'request': request})
     
     # Add full URLs for file downloads
     data = serializer.data
@@ -201,6 +295,37 @@ def version_detail(request, id, ver):
     
     return Response(data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
+def version_file_urls(request, id, ver):
+    """
+    Signed URLs for the files of a version, valid for SIGNED_URL_TTL to
+    twice that. Add ``download=1`` to a file URL for an attachment.
+    ``zip_query`` signs every ZIP endpoint of the version, including members.
+    """
+    version = get_object_or_404(Version.objects.select_related('paperwork'), paperwork_id=id, version_no=ver)
+    
+    # Researchers can only access their own paperworks
+    if request.user.role == 'RESEARCHER' and version.paperwork.researcher_id != request.user.id:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    expires = signedurls.expiry()
+    
+    def signed(name, args, file_type):
+        query = signedurls.sign(id, ver, file_type, request.user.id, expires)
+        return request.build_absolute_uri(f"{reverse(name, args=args)}?{urlencode(query)}")
+    
+    data = {'expires_at': datetime.fromtimestamp(expires, tz=timezone.utc)}
+    for file_type, field in [('pdf', 'pdf_path'), ('tex', 'latex_path'), ('zip', 'python_path'), ('docx', 'docx_path')]:
+        data[file_type] = (signed('view_paperwork_file', [id, ver, file_type], file_type)
+                           if getattr(version, field) else None)
+    if version.python_path:
+        data['zip_contents'] = signed('view_zip_contents', [id, ver], 'zip')
+        data['zip_tree'] = signed('view_zip_tree', [id, ver], 'zip')
+        data['zip_query'] = urlencode(signedurls.sign(id, ver, 'zip', request.user.id, expires))
+    return Response(data)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsAdmin, IsNotFrozen])
 @csrf_exempt
@@ -210,30 +335,39 @@ def review_paperwork(request, id):
     serializer = ReviewSerializer(data=request.data)
     
     if serializer.is_valid():
-        # Update paperwork status
-        paperwork.status = serializer.validated_data['status']
-        paperwork.save()
-        
-        # Create or update review
-        comments = serializer.validated_data.get('comments')
-        if comments:
-            Review.objects.create(
-                status=paperwork.status,
-                paperwork=paperwork,
-                comments=comments
+        with transaction.atomic():
+            # Lock the paperwork so the status counts see the status being replaced
+            previous_status = get_object_or_404(
+                PaperWork.objects.select_for_update().values_list('status', flat=True), id=id
             )
+            
+            # Update paperwork status
+            paperwork.status = serializer.validated_data['status']
+            paperwork.save(update_fields=['status', 'updated_at'])
+            statuscounts.record_transition(paperwork.researcher_id, previous_status, paperwork.status)
+            
+            # Create or update review
+            comments = serializer.validated_data.get('comments')
+            if comments:
+                Review.objects.create(
+                    status=paperwork.status,
+                    paperwork=paperwork,
+                    comments=comments
+                )
+            
+            # Create notification for review
+            notification = Notification.objects.create(
+                event='CHANGES_REQUESTED' if paperwork.status == 'CHANGES_REQUESTED' else 'APPROVED',
+                paper=paperwork
+            )
+            inbox.deliver([notification])
         
-        # Create notification for review
-        Notification.objects.create(
-            event='CHANGES_REQUESTED' if paperwork.status == 'CHANGES_REQUESTED' else 'APPROVED',
-            paper=paperwork
-        )
-        
-        return Response(PaperWorkSerializer(paperwork).data)
+        return Response(PaperWorkSerializer(paperwork, context={'request': request}).data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_read
 def paperwork_reviews(request, id):
     paperwork = get_object_or_404(PaperWork, id=id)
     
@@ -242,104 +376,135 @@ def paperwork_reviews(request, id):
         return Response({"detail": "You do not have permission to view these reviews."}, 
                         status=status.HTTP_403_FORBIDDEN)
     
-    reviews = Review.objects.filter(paperwork=paperwork).order_by('-created_at')
+    reviews = Review.objects.filter(paperwork=paperwork)
+    try:
+        reviews, page = pagination.paginate(request, reviews, ('-created_at', '-id'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     serializer = ReviewModelSerializer(reviews, many=True)
     
-    return Response(serializer.data)
+    return Response({'results': serializer.data, **page})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin, IsNotFrozen])
+@replica_read
 def reports_summary(request):
     
-    # Get total papers count
-    total_papers = PaperWork.objects.count()
-    
-    # Get papers by status
-    papers_by_status = PaperWork.objects.values('status').annotate(count=Count('id'))
-    status_dict = {item['status']: item['count'] for item in papers_by_status}
-    
-    # Get papers by researcher
-    papers_by_researcher = PaperWork.objects.values('researcher__username').annotate(count=Count('id'))
-    researcher_dict = {item['researcher__username']: item['count'] for item in papers_by_researcher}
-    
-    # Get average AI percentage
-    avg_ai_percent = Version.objects.aggregate(avg=Avg('ai_percent_verified'))['avg'] or 0
-    
-    data = {
-        'total_papers': total_papers,
-        'papers_by_status': status_dict,
-        'papers_by_researcher': researcher_dict,
-        'average_ai_percentage': avg_ai_percent
-    }
-    
-    serializer = ReportSummarySerializer(data)
+    serializer = ReportSummarySerializer(reports.summary())
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin, IsNotFrozen])
+@replica_read
 def reports_export(request):
-    
+    """
+    CSV of all paperworks, streamed.
+
+    Optional filters: ``status`` (comma separated), ``researcher`` (id or
+    username), ``from`` and ``to`` (assignment dates, YYYY-MM-DD, inclusive).
+    """
+    statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+    valid_statuses = {choice for choice, _ in PaperWork.STATUS_CHOICES}
+    if any(value not in valid_statuses for value in statuses):
+        return Response({'error': f"status must be one of {', '.join(sorted(valid_statuses))}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    dates = {}
+    for param in ('from', 'to'):
+        value = request.query_params.get(param)
+        try:
+            dates[param] = parse_date(value) if value else None
+        except ValueError:
+            dates[param] = None
+        if value and dates[param] is None:
+            return Response({'error': f'{param} must be a date (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+
+    queryset = reports.export_queryset(
+        statuses=statuses,
+        researcher=request.query_params.get('researcher'),
+        assigned_from=dates['from'],
+        assigned_to=dates['to'],
+    ).using(replicas.read_database())
+
     # Create CSV response
-    response = HttpResponse(content_type='text/csv')
+    response = StreamingHttpResponse(
+        delivery.streaming_content(request, reports.csv_chunks(queryset), thread_sensitive=True),
+        content_type='text/csv'
+    )
     response['Content-Disposition'] = 'attachment; filename="papers_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Title', 'Researcher', 'Status', 'Assigned At', 'Latest Version', 'AI Percentage'])
-    
-    paperworks = PaperWork.objects.all()
-    for paper in paperworks:
-        # Get latest version if exists
-        latest_version = Version.objects.filter(paperwork=paper).order_by('-version_no').first()
-        version_no = latest_version.version_no if latest_version else 'N/A'
-        ai_percent = latest_version.ai_percent_verified if latest_version else 'N/A'
-        
-        writer.writerow([
-            paper.id,
-            paper.title,
-            paper.researcher.username,
-            paper.status,
-            paper.assigned_at.strftime('%Y-%m-%d'),
-            version_no,
-            ai_percent
-        ])
-    
     return response
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
 def notifications_list(request):
-    # Get notifications relevant to the user
-    if request.user.role == 'RESEARCHER':
-        # Researchers only see notifications for their papers
-        notifications = Notification.objects.filter(paper__researcher=request.user).order_by('-at')
-    else:
-        # Admins see all notifications
-        notifications = Notification.objects.all().order_by('-at')
+    # Every user reads their own inbox, ?unread=true for the unread items only
+    notifications = InboxItem.objects.filter(recipient=request.user)
+    if request.query_params.get('unread') == 'true':
+        notifications = notifications.filter(read=False)
+    
+    notifications = expansion.expand_queryset(notifications, InboxItemSerializer, request)
+    try:
+        notifications, page = pagination.paginate(request, notifications, ('-at', '-id'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = InboxItemSerializer(notifications, many=True, context={'request': request})
+    return Response({'results': serializer.data, **page})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
+def notifications_unread_count(request):
+    return Response({'unread_count': inbox.unread_count(request.user)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+def notifications_stream_url(request):
+    """
+    A URL opening the user's notification stream without an Authorization
+    header, for EventSource. It must be opened within
+    NOTIFICATION_STREAM_URL_TTL seconds; fetch a new one to reconnect later.
+    """
+    query = signedurls.sign_stream(request.user.id)
+    return Response({
+        'url': request.build_absolute_uri(f"{streams.STREAM_PATH}?{urlencode(query)}"),
+        'expires_at': datetime.fromtimestamp(int(query['exp']), tz=timezone.utc),
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def notifications_mark_read(request):
+    serializer = MarkReadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    serializer = NotificationSerializer(notifications, many=True)
-    return Response(serializer.data)
+    updated = inbox.mark_read(request.user, serializer.validated_data['ids'])
+    return Response({'updated': updated, 'unread_count': inbox.unread_count(request.user)})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsNotFrozen])
+@csrf_exempt
+def notifications_mark_all_read(request):
+    updated = inbox.mark_read(request.user)
+    return Response({'updated': updated, 'unread_count': inbox.unread_count(request.user)})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsNotFrozen])
+@replica_read
 def researcher_stats(request):
     # Only researchers can access their own stats
     if request.user.role != 'RESEARCHER':
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    # Get all paperworks for this researcher
-    paperworks = PaperWork.objects.filter(researcher=request.user)
-    
     # Calculate statistics
-    total_paperwork = paperworks.count()
-    pending_review = paperworks.filter(status='SUBMITTED').count()
-    approved = paperworks.filter(status='APPROVED').count()
-    changes_requested = paperworks.filter(status='CHANGES_REQUESTED').count()
+    counts = statuscounts.counts(researcher=request.user)
     
     data = {
-        'total_paperwork': total_paperwork,
-        'pending_review': pending_review,
-        'approved': approved,
-        'changes_requested': changes_requested
+        'total_paperwork': counts['total'],
+        'pending_review': counts['SUBMITTED'],
+        'approved': counts['APPROVED'],
+        'changes_requested': counts['CHANGES_REQUESTED']
     }
     
     serializer = ResearcherStatsSerializer(data)
@@ -355,51 +520,41 @@ def delete_paperwork(request, id):
     if request.user.role != 'ADMIN' and (request.user.role == 'RESEARCHER' and paperwork.researcher != request.user):
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    # Get all versions to delete associated files
-    versions = Version.objects.filter(paperwork=paperwork)
-    
-    # Delete all files associated with this paperwork
-    for version in versions:
-        # Delete PDF file if exists
-        if version.pdf_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, version.pdf_path)):
-            os.remove(os.path.join(settings.MEDIA_ROOT, version.pdf_path))
-        
-        # Delete LaTeX file if exists
-        if version.latex_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, version.latex_path)):
-            os.remove(os.path.join(settings.MEDIA_ROOT, version.latex_path))
-        
-        # Delete Python ZIP file if exists
-        if version.python_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, version.python_path)):
-            os.remove(os.path.join(settings.MEDIA_ROOT, version.python_path))
-        
-        # Delete DOCX file if exists
-        if version.docx_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, version.docx_path)):
-            os.remove(os.path.join(settings.MEDIA_ROOT, version.docx_path))
-    
-    # Delete the paperwork (this will cascade delete versions and notifications)
-    paperwork.delete()
+    while True:
+        try:
+            with transaction.atomic():
+                paperwork = get_object_or_404(PaperWork.objects.select_for_update(), id=id)
+                statuscounts.record_transition(paperwork.researcher_id, paperwork.status, None)
+                
+                # Release the files of every version, shared blobs stay until unreferenced
+                rows = list(Version.objects.filter(paperwork=paperwork).values_list('id', *blobstore.PATH_FIELDS))
+                removable = retention.delete_versions(rows)
+                inbox.release(InboxItem.objects.filter(paper=paperwork))
+                
+                # Delete the paperwork (this will cascade delete notifications)
+                paperwork.delete()
+            break
+        except retention.ConcurrentDeletion:
+            # The pruner removed some versions meanwhile, start over
+            continue
+    blobstore.unlink_files(removable)
     
     return Response({'message': 'Research task deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin, IsNotFrozen])
+@replica_read
 def admin_stats(request):
     # Only admins can access these stats
     
-    # Get all paperworks
-    paperworks = PaperWork.objects.all()
-    
     # Calculate statistics
-    total_paperwork = paperworks.count()
-    submitted = paperworks.filter(status='SUBMITTED').count()
-    approved = paperworks.filter(status='APPROVED').count()
-    changes_requested = paperworks.filter(status='CHANGES_REQUESTED').count()
+    counts = statuscounts.counts()
     
     data = {
-        'total_paperwork': total_paperwork,
-        'submitted': submitted,
-        'approved': approved,
-        'changes_requested': changes_requested
+        'total_paperwork': counts['total'],
+        'submitted': counts['SUBMITTED'],
+        'approved': counts['APPROVED'],
+        'changes_requested': counts['CHANGES_REQUESTED']
     }
     
     serializer = AdminStatsSerializer(data)
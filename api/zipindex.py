@@ -0,0 +1,446 @@
+"""
+Central-directory indexes of code ZIPs.
+
+The code browser lists a ZIP and opens its members one request at a time.
+Instead of re-parsing the central directory on every call, each ZIP gets a
+JSON index under ``ZIP_INDEX_PATH`` mapping member names to their local
+header offset, sizes, CRC and compression. Indexes are built when a version
+is submitted (or on first use for older ZIPs), kept in an in-process LRU and
+invalidated when the ZIP's size or mtime no longer matches.
+
+Blob ZIPs are indexed by their content hash, so identical uploads share an
+index; legacy ZIPs by a hash of their path.
+"""
+import base64
+import bisect
+import fnmatch
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import struct
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_SIZE = 256
+INDEX_FORMAT = 1
+
+# Local file header: signature, versions, flags, method, time, date, crc, sizes, name and extra lengths
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+MEMBER_CHUNK_SIZE = 256 * 1024
+
+# Types of files commonly found in code submissions that ``mimetypes`` does
+# not know or gets wrong; everything else falls back to ``mimetypes``
+MEMBER_CONTENT_TYPES = {
+    'py': 'text/x-python',
+    'pyi': 'text/x-python',
+    'ipynb': 'application/json',
+    'r': 'text/x-r',
+    'rmd': 'text/markdown',
+    'jl': 'text/x-julia',
+    'm': 'text/x-matlab',
+    'java': 'text/x-java',
+    'kt': 'text/x-kotlin',
+    'scala': 'text/x-scala',
+    'go': 'text/x-go',
+    'rs': 'text/x-rust',
+    'c': 'text/x-c',
+    'h': 'text/x-c',
+    'cc': 'text/x-c++',
+    'cpp': 'text/x-c++',
+    'hpp': 'text/x-c++',
+    'cu': 'text/x-cuda',
+    'js': 'text/javascript',
+    'mjs': 'text/javascript',
+    'ts': 'text/x-typescript',
+    'sh': 'text/x-sh',
+    'bash': 'text/x-sh',
+    'sql': 'text/x-sql',
+    'md': 'text/markdown',
+    'rst': 'text/x-rst',
+    'tex': 'text/x-tex',
+    'bib': 'text/x-bibtex',
+    'txt': 'text/plain',
+    'log': 'text/plain',
+    'cfg': 'text/plain',
+    'ini': 'text/plain',
+    'toml': 'application/toml',
+    'yaml': 'application/yaml',
+    'yml': 'application/yaml',
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+    'xml': 'application/xml',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'svg': 'image/svg+xml',
+    'webp': 'image/webp',
+    'pdf': 'application/pdf',
+    'npy': 'application/octet-stream',
+    'npz': 'application/octet-stream',
+    'pkl': 'application/octet-stream',
+    'h5': 'application/x-hdf5',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Non text/* types whose content is text
+TEXT_CONTENT_TYPES = {'application/json', 'application/toml', 'application/yaml', 'application/xml'}
+
+ZipEntry = namedtuple('ZipEntry', [
+    'name', 'header_offset', 'compress_size', 'file_size', 'crc', 'compress_type', 'flag_bits', 'date_time',
+])
+
+class DirStats:
+    """Aggregates of everything below a directory, precomputed once per loaded index."""
+
+    __slots__ = ('path', 'file_count', 'dir_count', 'size', 'compress_size', 'date_time', 'children')
+
+    def __init__(self, path):
+        self.path = path
+        self.file_count = self.dir_count = self.size = self.compress_size = 0
+        self.date_time = None
+        self.children = set()
+
+class ZipIndex:
+    def __init__(self, entries, zip_size, zip_mtime_ns):
+        self.entries = OrderedDict((entry.name, entry) for entry in entries)
+        self.zip_size = zip_size
+        self.zip_mtime_ns = zip_mtime_ns
+        self._dirs = None
+
+    @property
+    def dirs(self):
+        """Directory path (``''`` for the root, otherwise ending in ``/``) -> DirStats."""
+        if self._dirs is None:
+            self._dirs = self._build_dirs()
+        return self._dirs
+
+    def _build_dirs(self):
+        dirs = {'': DirStats('')}
+
+        def ensure(path):
+            # Archives often omit explicit entries for intermediate folders
+            if path not in dirs:
+                dirs[path] = DirStats(path)
+                parent = ensure(parent_dir(path))
+                parent.children.add(path)
+                for ancestor in ancestors(path):
+                    dirs[ancestor].dir_count += 1
+            return dirs[path]
+
+        for entry in self.entries.values():
+            if entry.name.endswith('/'):
+                ensure(entry.name)
+                continue
+            ensure(parent_dir(entry.name)).children.add(entry.name)
+            for path in ancestors(entry.name):
+                stats = dirs[path]
+                stats.file_count += 1
+                stats.size += entry.file_size
+                stats.compress_size += entry.compress_size
+                if stats.date_time is None or tuple(entry.date_time) > stats.date_time:
+                    stats.date_time = tuple(entry.date_time)
+
+        for stats in dirs.values():
+            stats.children = sorted(stats.children)
+        return dirs
+
+    @property
+    def names(self):
+        return list(self.entries)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def matches(self, stat):
+        return self.zip_size == stat.st_size and self.zip_mtime_ns == stat.st_mtime_ns
+
+    def to_json(self):
+        return {
+            'format': INDEX_FORMAT,
+            'zip_size': self.zip_size,
+            'zip_mtime_ns': self.zip_mtime_ns,
+            'entries': [list(entry) for entry in self.entries.values()],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        entries = [ZipEntry(*entry[:-1], tuple(entry[-1])) for entry in data['entries']]
+        return cls(entries, data['zip_size'], data['zip_mtime_ns'])
+
+# index rel_path -> ZipIndex
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def index_path(rel_path):
+    """Volume independent path of the index of the ZIP stored at ``rel_path``."""
+    if rel_path.startswith(f"{settings.BLOB_STORAGE_PATH}/"):
+        key = os.path.basename(rel_path)
+    else:
+        key = hashlib.sha256(rel_path.encode()).hexdigest()
+    return f"{settings.ZIP_INDEX_PATH}/{key[:2]}/{key[2:4]}/{key}.json"
+
+def build(rel_path, full_path=None):
+    """
+    Parse the central directory of the ZIP at ``rel_path`` and persist its index.
+
+    The index is written to the ZIP's volume. Raises
+    ``zipfile.BadZipFile`` if the file is not a ZIP.
+    """
+    full_path = full_path or storage.locate(rel_path)
+    stat = os.stat(full_path)
+    with zipfile.ZipFile(full_path) as archive:
+        entries = [
+            ZipEntry(info.filename, info.header_offset, info.compress_size, info.file_size,
+                     info.CRC, info.compress_type, info.flag_bits, info.date_time)
+            for info in archive.infolist()
+        ]
+    index = ZipIndex(entries, stat.st_size, stat.st_mtime_ns)
+
+    target = storage.path_on(storage.volume_of(full_path), index_path(rel_path))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{threading.get_ident()}.tmp"
+    with open(tmp_target, 'w') as destination:
+        json.dump(index.to_json(), destination, separators=(',', ':'))
+    os.replace(tmp_target, target)
+    _remember(index_path(rel_path), index)
+    return index
+
+def prebuild(rel_path):
+    """Build the index of a freshly submitted ZIP; uploads that are not ZIPs are skipped."""
+    if not rel_path:
+        return
+    try:
+        load(rel_path)
+    except (zipfile.BadZipFile, OSError):
+        logger.info('Not indexing %s, it is not a readable ZIP', rel_path)
+
+def load(rel_path):
+    """
+    Index of the ZIP stored at ``rel_path``, or None if the ZIP is missing.
+
+    Served from the in-process cache while the ZIP is unchanged, then from
+    the persisted index, and rebuilt if neither matches.
+    """
+    full_path = storage.locate(rel_path)
+    if full_path is None:
+        return None
+    stat = os.stat(full_path)
+    key = index_path(rel_path)
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+    if index is not None and index.matches(stat):
+        return index
+
+    index_file = storage.locate(key)
+    if index_file is not None:
+        try:
+            with open(index_file) as source:
+                data = json.load(source)
+            if data.get('format') == INDEX_FORMAT:
+                index = ZipIndex.from_json(data)
+                if index.matches(stat):
+                    _remember(key, index)
+                    return index
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning('Rebuilding unreadable ZIP index %s', index_file)
+
+    return build(rel_path, full_path)
+
+def _remember(key, index):
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+def forget(rel_path):
+    """Delete the index of ``rel_path`` from every volume and the cache."""
+    key = index_path(rel_path)
+    storage.remove(key)
+    with _indexes_lock:
+        _indexes.pop(key, None)
+
+def open_member(full_path, entry):
+    """
+    Open a member of the ZIP at ``full_path`` for reading without parsing
+    the central directory; the caller closes the returned file.
+    """
+    if entry.flag_bits & 0x1:
+        raise RuntimeError(f"File {entry.name!r} is encrypted")
+
+    source = open(full_path, 'rb')
+    try:
+        source.seek(entry.header_offset)
+        header = source.read(_LOCAL_HEADER.size)
+        if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local header for {entry.name!r}")
+        fields = _LOCAL_HEADER.unpack(header)
+        source.seek(fields[10] + fields[11], os.SEEK_CUR)
+
+        info = zipfile.ZipInfo(entry.name, tuple(entry.date_time))
+        info.compress_type = entry.compress_type
+        info.compress_size = entry.compress_size
+        info.file_size = entry.file_size
+        info.CRC = entry.crc
+        info.flag_bits = entry.flag_bits
+        return zipfile.ZipExtFile(source, 'rb', info, close_fileobj=True)
+    except Exception:
+        source.close()
+        raise
+
+def read_member(full_path, entry):
+    with open_member(full_path, entry) as member:
+        return member.read()
+
+def member_content_type(name):
+    basename = os.path.basename(name)
+    if '.' not in basename:
+        # README, Makefile, LICENSE and friends
+        return 'text/plain'
+    extension = basename.rsplit('.', 1)[-1].lower()
+    return MEMBER_CONTENT_TYPES.get(extension) or mimetypes.guess_type(basename)[0] or 'application/octet-stream'
+
+def is_text(content_type):
+    return content_type.startswith('text/') or content_type in TEXT_CONTENT_TYPES
+
+def member_etag(zip_etag, entry):
+    """Strong ETag of a member, derived from the ZIP's ETag, the member name and its CRC."""
+    name_hash = hashlib.sha256(entry.name.encode()).hexdigest()[:16]
+    return f'{zip_etag[:-1]}-{name_hash}-{entry.crc:08x}"'
+
+def read_member_range(full_path, entry, start, count):
+    """
+    Yield ``count`` decompressed bytes of a member starting at ``start``.
+
+    Decompression is incremental; seeking into a compressed member
+    decompresses and discards the bytes before ``start``.
+    """
+    with open_member(full_path, entry) as member:
+        if start:
+            member.seek(start)
+        while count > 0:
+            chunk = member.read(min(MEMBER_CHUNK_SIZE, count))
+            if not chunk:
+                break
+            count -= len(chunk)
+            yield chunk
+
+def parent_dir(name):
+    """Directory containing ``name``: ``'a/b/'`` for ``'a/b/c.py'`` and ``'a/b/c/'``."""
+    head = name[:-1] if name.endswith('/') else name
+    return head.rsplit('/', 1)[0] + '/' if '/' in head else ''
+
+def ancestors(name):
+    """All directories containing ``name``, from the root down."""
+    result = ['']
+    head = name[:-1] if name.endswith('/') else name
+    parts = head.split('/')[:-1]
+    for i in range(len(parts)):
+        result.append('/'.join(parts[:i + 1]) + '/')
+    return result
+
+def encode_cursor(path):
+    return base64.urlsafe_b64encode(path.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor.encode(), altchars=b'-_', validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def list_tree(index, prefix='', depth=1, pattern=None, after=None, limit=200):
+    """
+    One page of the entries below directory ``prefix``, ``depth`` levels deep.
+
+    Entries are ordered by path and the page starts after the path ``after``.
+    ``pattern`` is a glob matched against file paths; directories are kept
+    when they contain a match. Returns ``(entries, last_path)`` where
+    ``last_path`` is None on the last page.
+    """
+    root = index.dirs.get(prefix)
+    if root is None:
+        return None, None
+
+    def walk(stats, level):
+        for child in stats.children:
+            yield child
+            if child.endswith('/') and level < depth:
+                yield from walk(index.dirs[child], level + 1)
+
+    matching_dirs = None
+    if pattern:
+        matching_dirs = set()
+        for name in index.entries:
+            if not name.endswith('/') and name.startswith(prefix) and fnmatch.fnmatchcase(name, pattern):
+                matching_dirs.update(ancestors(name))
+
+    if depth == 1:
+        # A single level is already sorted
+        names = root.children[bisect.bisect_right(root.children, after):] if after else root.children
+    else:
+        names = sorted(name for name in walk(root, 1) if after is None or name > after)
+    page = []
+    for name in names:
+        if pattern:
+            if name.endswith('/') and name not in matching_dirs:
+                continue
+            if not name.endswith('/') and not fnmatch.fnmatchcase(name, pattern):
+                continue
+        page.append(describe(index, name))
+        if len(page) > limit:
+            break
+
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]['path']
+    return page, None
+
+def _iso(date_time):
+    if date_time is None:
+        return None
+    year, month, day, hour, minute, second = date_time
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}"
+
+def describe(index, name):
+    """Listing entry for a member or directory of ``index``."""
+    depth = name.rstrip('/').count('/')
+    label = name.rstrip('/').rsplit('/', 1)[-1]
+    if name.endswith('/'):
+        stats = index.dirs[name]
+        explicit = index.get(name)
+        return {
+            'path': name,
+            'name': label,
+            'type': 'dir',
+            'depth': depth,
+            'size': stats.size,
+            'compressed_size': stats.compress_size,
+            'modified': _iso(stats.date_time or (tuple(explicit.date_time) if explicit else None)),
+            'file_count': stats.file_count,
+            'dir_count': stats.dir_count,
+        }
+    entry = index.get(name)
+    return {
+        'path': name,
+        'name': label,
+        'type': 'file',
+        'depth': depth,
+        'size': entry.file_size,
+        'compressed_size': entry.compress_size,
+        'crc': f"{entry.crc:08x}",
+        'modified': _iso(entry.date_time),
+    }
@@ -252,13 +252,14 @@ class AdminAPITester:
             response = requests.get(
                 f"{API_URL}paperworks/",
                 headers=self.headers,
+                params={'expand': 'researcher'},
                 timeout=10
             )
             
             self.last_response = response
             
             if response.status_code == 200:
-                paperworks = response.json()
+                paperworks = response.json()["results"]
                 print(f"{Fore.GREEN}✅ Retrieved {len(paperworks)} paperworks{Style.RESET_ALL}")
                 
                 # Store for later use
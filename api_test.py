@@ -83,13 +83,14 @@ class APITester:
             response = requests.get(
                 f"{self.base_url}paperworks/",
                 headers=self.headers,
+                params={'expand': 'researcher'},
                 timeout=10
             )
             
             self.last_response = response
             
             if response.status_code == 200:
-                paperworks = response.json()
+                paperworks = response.json()["results"]
                 print(f"{Fore.GREEN}✅ Retrieved {len(paperworks)} paperworks{Style.RESET_ALL}")
                 
                 if paperworks:
@@ -128,6 +129,7 @@ class APITester:
             response = requests.get(
                 f"{self.base_url}paperworks/{paperwork_id}/", 
                 headers=self.headers,
+                params={'expand': 'researcher'},
                 timeout=10
             )
             
@@ -173,7 +175,7 @@ class APITester:
             self.last_response = response
             
             if response.status_code == 200:
-                versions = response.json()
+                versions = response.json()["results"]
                 print(f"{Fore.GREEN}✅ Retrieved {len(versions)} versions for paperwork{Style.RESET_ALL}")
                 
                 if versions:
@@ -298,6 +300,7 @@ class APITester:
             response = requests.post(
                 f"{self.base_url}paperworks/{paperwork_id}/review/", 
                 headers=self.headers,
+                params={'expand': 'researcher'},
                 json=review_data,
                 timeout=10
             )
@@ -381,13 +384,14 @@ class APITester:
             response = requests.get(
                 f"{self.base_url}notifications/", 
                 headers=self.headers,
+                params={'expand': 'paper'},
                 timeout=10
             )
             
             self.last_response = response
             
             if response.status_code == 200:
-                notifications = response.json()
+                notifications = response.json()["results"]
                 print(f"{Fore.GREEN}✅ Retrieved {len(notifications)} notifications{Style.RESET_ALL}")
                 
                 if notifications:
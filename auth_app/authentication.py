@@ -0,0 +1,126 @@
+"""
+JWT authentication without per-request database work.
+
+simplejwt's JWTAuthentication checks the token signature and loads the user
+row on every request. CachedJWTAuthentication keeps
+
+- validated access tokens in a per-process LRU of AUTH_TOKEN_CACHE_SIZE
+  entries, used until the token expires, and
+- a snapshot of each user, every field except the password, in the default
+  cache for AUTH_USER_CACHE_SECONDS. Snapshots are only kept while that
+  cache is shared by all workers (CACHE_BACKEND); with a per-process cache
+  every request loads the user.
+
+A request whose token and user are cached costs no query; the user is a
+regular User instance with the password deferred. Views that change a
+user's status, role or active flag call ``forget_user``: once the change
+commits the snapshot is dropped and the change is published through the
+notification stream broker, so every worker drops the snapshot again and
+ends the user's open streams if they were frozen or deactivated.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from pms_server import caches
+from .models import User
+
+# Everything but the password hash goes into the cache
+SNAPSHOT_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+class TokenCache:
+    """LRU of validated tokens by their encoded form, dropping them once expired."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, raw_token):
+        with self._lock:
+            token = self._tokens.get(raw_token)
+            if token is None:
+                return None
+            if token.get('exp', 0) <= time.time():
+                del self._tokens[raw_token]
+                return None
+            self._tokens.move_to_end(raw_token)
+            return token
+
+    def put(self, raw_token, token):
+        with self._lock:
+            self._tokens[raw_token] = token
+            self._tokens.move_to_end(raw_token)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+tokens = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+def cached_user(user_id):
+    """The user with ``user_id`` from its snapshot, loading it on a miss; None if there is no such user."""
+    # A snapshot in a per-process cache would outlive changes made in other workers
+    shared = caches.shared()
+    values = cache.get(_user_key(user_id)) if shared else None
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*SNAPSHOT_FIELDS).first()
+        if values is None:
+            return None
+        if shared:
+            cache.set(_user_key(user_id), values, timeout=settings.AUTH_USER_CACHE_SECONDS)
+    return User.from_db('default', SNAPSHOT_FIELDS, values)
+
+def drop_snapshot(user_id):
+    cache.delete(_user_key(user_id))
+
+def forget_user(user_id):
+    """
+    Once the current transaction commits, drop ``user_id``'s snapshot and
+    tell every worker the user changed.
+    """
+    # streams imports this module
+    from api import streams
+
+    def forget():
+        drop_snapshot(user_id)
+        streams.publish_user_change(user_id)
+    transaction.on_commit(forget)
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication reading validated tokens and users from the caches above."""
+
+    def get_validated_token(self, raw_token):
+        token = tokens.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            tokens.put(raw_token, token)
+        return token
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is not cached
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken('Token contained no recognizable user identification') from e
+
+        user = cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
@@ -0,0 +1,150 @@
+"""
+Firebase ID-token verification against an in-process copy of Google's keys.
+
+firebase_admin's verify_id_token fetches Google's signing certificates over
+HTTP from inside the request whenever its copy has expired. GoogleKeys keeps
+the certificates for the max-age of the response's Cache-Control header and,
+once fewer than FIREBASE_KEYS_REFRESH_AHEAD seconds remain, fetches the next
+set on a background thread while requests keep using the current one. A
+request only waits for Google when
+
+- there are no keys yet or they have expired, or
+- the token names a key id that is not in the set (Google rotated its keys),
+  at most once per FIREBASE_KEYS_MIN_FETCH_INTERVAL.
+
+When a fetch fails, expired keys are used until one succeeds. With
+FIREBASE_KEYS_URL set to ``offline`` nothing is fetched: the set holds one
+key generated when the process starts and ``offline_token`` signs ID tokens
+with it, for tests and local development.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import urllib.request
+import firebase_admin
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+OFFLINE = 'offline'
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+class KeyFetchError(Exception):
+    """Google's signing keys could not be fetched and there is no earlier copy."""
+
+class GoogleKeys:
+    """Google's public keys by key id, kept until the fetched set expires."""
+
+    def __init__(self, url):
+        self.url = url
+        self._keys = {}
+        self._expires = 0.0
+        self._fetched = 0.0
+        self._fetch_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self.offline_key = None
+        if url == OFFLINE:
+            self.offline_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            self._keys = {OFFLINE: self.offline_key.public_key()}
+            self._expires = float('inf')
+
+    def get(self, kid):
+        """The public key ``kid``, or None if Google has no such key."""
+        now = time.time()
+        if self.offline_key is not None:
+            return self._keys.get(kid)
+        if kid in self._keys and now < self._expires:
+            if now >= self._expires - settings.FIREBASE_KEYS_REFRESH_AHEAD:
+                self._refresh_in_background(now)
+            return self._keys[kid]
+        if now >= self._expires or now - self._fetched >= settings.FIREBASE_KEYS_MIN_FETCH_INTERVAL:
+            self._fetch(now)
+        return self._keys.get(kid)
+
+    def _refresh_in_background(self, requested):
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch(requested)
+            finally:
+                self._refreshing = False
+        threading.Thread(target=refresh, name='google-keys-refresh', daemon=True).start()
+
+    def _fetch(self, requested):
+        with self._fetch_lock:
+            if self._fetched > requested:
+                # Another thread fetched while this one waited
+                return
+            try:
+                with urllib.request.urlopen(self.url, timeout=settings.FIREBASE_KEYS_TIMEOUT) as response:
+                    certificates = json.load(response)
+                    cache_control = response.headers.get('Cache-Control', '')
+                    age = int(response.headers.get('Age') or 0)
+                keys = {
+                    kid: x509.load_pem_x509_certificate(pem.encode()).public_key()
+                    for kid, pem in certificates.items()
+                }
+            except (OSError, ValueError) as e:
+                if not self._keys:
+                    raise KeyFetchError(f'Could not fetch Google signing keys: {e}') from e
+                logger.warning('Fetching Google signing keys failed, keeping the previous set: %s', e)
+                self._fetched = time.time()
+                # Retry no more than once per interval
+                self._expires = max(self._expires, self._fetched + settings.FIREBASE_KEYS_MIN_FETCH_INTERVAL)
+                return
+            max_age = _MAX_AGE.search(cache_control)
+            lifetime = int(max_age.group(1)) - age if max_age else settings.FIREBASE_KEYS_REFRESH_AHEAD
+            self._fetched = time.time()
+            self._keys = keys
+            self._expires = self._fetched + max(lifetime, 0)
+
+keys = GoogleKeys(settings.FIREBASE_KEYS_URL)
+
+def project_id():
+    return settings.FIREBASE_PROJECT_ID or firebase_admin.get_app().project_id
+
+def _issuer():
+    return f'https://securetoken.google.com/{project_id()}'
+
+def verify_id_token(id_token):
+    """
+    The claims of a Firebase ID token, with ``uid`` set to its subject like
+    firebase_admin does. Raises jwt.InvalidTokenError for an invalid or
+    expired token and KeyFetchError when Google's keys are unavailable.
+    """
+    header = jwt.get_unverified_header(id_token)
+    if header.get('alg') != 'RS256':
+        raise jwt.InvalidAlgorithmError('ID token must be signed with RS256')
+    key = keys.get(header.get('kid'))
+    if key is None:
+        raise jwt.InvalidTokenError('ID token was signed with an unknown key')
+    claims = jwt.decode(
+        id_token, key, algorithms=['RS256'], audience=project_id(), issuer=_issuer(),
+        leeway=settings.FIREBASE_ID_TOKEN_LEEWAY, options={'require': ['exp', 'iat', 'sub', 'auth_time']},
+    )
+    if not claims['sub'] or len(claims['sub']) > 128:
+        raise jwt.InvalidTokenError('ID token has an invalid subject')
+    if claims['auth_time'] > time.time() + settings.FIREBASE_ID_TOKEN_LEEWAY:
+        raise jwt.ImmatureSignatureError('ID token was authenticated in the future')
+    claims['uid'] = claims['sub']
+    return claims
+
+def offline_token(claims, lifetime=3600):
+    """An ID token signed with the offline key, for a set of claims on top of the required ones."""
+    if keys.offline_key is None:
+        raise RuntimeError('offline_token needs FIREBASE_KEYS_URL = "offline"')
+    now = int(time.time())
+    payload = {'iss': _issuer(), 'aud': project_id(), 'iat': now, 'exp': now + lifetime, 'auth_time': now}
+    payload.update(claims)
+    return jwt.encode(payload, keys.offline_key, algorithm='RS256', headers={'kid': OFFLINE})
@@ -0,0 +1,63 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auth_app import authentication
+from auth_app.models import User
+from auth_app.utils import IsAdmin, IsNotFrozen
+
+class Command(BaseCommand):
+    help = ('Measures the authentication and permission overhead of a request with simplejwt\'s '
+            'JWTAuthentication and with CachedJWTAuthentication')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Requests authenticated per run.')
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f"authbench-{uuid.uuid4().hex[:8]}", role='ADMIN')
+        try:
+            header = f'Bearer {AccessToken.for_user(user)}'
+            authentication.tokens.clear()
+            authentication.forget_user(user.id)
+
+            self.stdout.write(f"{'authentication':<16} {'per request':>12} {'queries':>8}")
+            for name, authenticator in [('jwt', JWTAuthentication()),
+                                        ('cached', authentication.CachedJWTAuthentication())]:
+                per_request, queries = self.run(authenticator, header, options['requests'])
+                self.stdout.write(f"{name:<16} {per_request * 1e6:>10.1f}us {queries:>8.2f}")
+
+            # Freezing must apply to the very next request
+            user.status = 'FROZEN'
+            user.save()
+            authentication.forget_user(user.id)
+            request = self.request(header)
+            authenticated, _ = authentication.CachedJWTAuthentication().authenticate(request)
+            request.user = authenticated
+            refused = not IsNotFrozen().has_permission(request, None)
+            style = self.style.SUCCESS if refused else self.style.ERROR
+            self.stdout.write(style(f"frozen user refused on the next request: {refused}"))
+        finally:
+            user.delete()
+            authentication.forget_user(user.id)
+
+    @staticmethod
+    def request(header):
+        return Request(RequestFactory().get('/api/paperworks/', HTTP_AUTHORIZATION=header))
+
+    def run(self, authenticator, header, count):
+        """Seconds and queries per request for authentication plus the admin permission checks."""
+        requests = [self.request(header) for _ in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for request in requests:
+                user, _ = authenticator.authenticate(request)
+                request.user = user
+                assert IsAdmin().has_permission(request, None) and IsNotFrozen().has_permission(request, None)
+            elapsed = time.perf_counter() - started
+        return elapsed / count, len(queries) / count
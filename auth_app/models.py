@@ -36,3 +36,7 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_id'),
+        ]
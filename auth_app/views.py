@@ -10,13 +10,14 @@ from .serializers import (
     CustomTokenObtainPairSerializer
 )
 from .models import User
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from .serializers import FirebaseLoginSerializer
 from .utils import IsAdmin
 from rest_framework_simplejwt.tokens import RefreshToken
-from firebase_admin import auth as firebase_auth
+from . import idtokens
 import auth_app.firebase_app
 from django.utils.text import slugify
+import jwt
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -62,27 +63,40 @@ def _issue_tokens_for_user(user: User) -> dict:
         },
     }
 
+def _free_username(base_username):
+    """``base_username``, or the first of base2, base3, ... not taken, found with one query."""
+    taken = {
+        name.lower() for name in
+        User.objects.filter(username__istartswith=base_username).values_list("username", flat=True)
+    }
+    username = base_username
+    counter = 1
+    while username.lower() in taken:
+        counter += 1
+        username = f"{base_username}{counter}"
+    return username
+
 @csrf_exempt
 @api_view(["POST"])
 @permission_classes([AllowAny])
-@transaction.atomic
 def google_login(request):
     """
     Accepts a Firebase ID token from the client (Google sign-in),
-    verifies it with Firebase Admin, upserts a local User, and
-    returns SimpleJWT tokens.
+    verifies it against Google's cached signing keys, upserts a local
+    User, and returns SimpleJWT tokens.
     """
     serializer = FirebaseLoginSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
     id_token = serializer.validated_data["id_token"]
 
-    # 1) Verify the Firebase ID token (raises if invalid/expired)
+    # 1) Verify the Firebase ID token (raises if invalid/expired), before
+    # touching the database
     try:
-        decoded = firebase_auth.verify_id_token(id_token)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+        decoded = idtokens.verify_id_token(id_token)
+    except jwt.InvalidTokenError as e:
         return Response({"detail": f"Invalid Firebase token: {str(e)}"}, status=status.HTTP_401_UNAUTHORIZED)
+    except idtokens.KeyFetchError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
     # 2) Extract claims
     email = decoded.get("email")
@@ -98,31 +112,27 @@ def google_login(request):
         return Response({"detail": "Email missing or not verified."}, status=status.HTTP_400_BAD_REQUEST)
 
     # 3) Upsert user in your DB
-    try:
-        user = User.objects.get(email__iexact=email)
-    except User.DoesNotExist:
+    user = User.objects.filter(email__iexact=email).first()
+    if user is None:
         base_username = slugify(email.split("@")[0]) or (uid or "")[:8] or "user"
-        username = base_username
-        counter = 1
-        while User.objects.filter(username__iexact=username).exists():
-            counter += 1
-            username = f"{base_username}{counter}"
-
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=None,         # no local password; Google-only sign-in
-            # set defaults if your User has extra fields:
-            role="RESEARCHER",
-            status="ACTIVE",
-        )
-        user.set_unusable_password()
-        if " " in name:
-            first, last = name.split(" ", 1)
-            user.first_name, user.last_name = first, last
-        else:
-            user.first_name = name
-        user.save()
+        first, _, last = name.partition(" ")
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=_free_username(base_username),
+                    email=email,
+                    password=None,         # no local password; Google-only sign-in
+                    role="RESEARCHER",
+                    status="ACTIVE",
+                    first_name=first,
+                    last_name=last,
+                )
+        except IntegrityError:
+            # A concurrent sign-in created the user or took the username
+            user = User.objects.filter(email__iexact=email).first()
+            if user is None:
+                return Response({"detail": "Sign-in conflicted with another, please retry."},
+                                status=status.HTTP_409_CONFLICT)
 
     # 4) Optional gate (e.g., only ACTIVE users)
     if getattr(user, "status", "ACTIVE") != "ACTIVE":
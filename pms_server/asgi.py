@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pms_server.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Sends files for views using FILE_DELIVERY_MODE = 'asgi'
+from api.delivery import SendfileMiddleware  # noqa: E402
+# Serves /api/notifications/stream/ without holding a Django worker per stream
+from api.streams import NotificationStreamMiddleware  # noqa: E402
+
+application = NotificationStreamMiddleware(SendfileMiddleware(django_application))
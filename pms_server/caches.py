@@ -0,0 +1,15 @@
+"""
+Whether the default cache is shared between worker processes.
+
+Read-your-writes windows (api/replicas.py) and user snapshots
+(auth_app/authentication.py) are only correct when every worker sees the
+same entries; with a per-process cache both fall back to the primary
+database instead.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+def shared():
+    """Whether every worker reads and writes the same default cache."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
@@ -0,0 +1,85 @@
+"""
+Database settings helpers used by settings.py.
+
+Kept free of Django imports so settings can use them before Django is set up.
+"""
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer, NORMAL sync is durable across application crashes in WAL mode,
+# and the mmap/cache sizes keep hot pages out of the syscall path.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+def sqlite_database(path, tuned=True, busy_timeout=20, pragmas=None, read_only=False):
+    """
+    A DATABASES entry for the SQLite file at ``path``.
+
+    When ``tuned`` the connection gets ``pragmas`` (SQLITE_PRAGMAS by
+    default), waits up to ``busy_timeout`` seconds for a lock instead of
+    failing with "database is locked", and starts every transaction with
+    BEGIN IMMEDIATE. Taking the write lock up front means a transaction that
+    reads before it writes can no longer fail on upgrading its lock.
+
+    ``read_only`` opens the file read-only, e.g. as the replica alias. Such a
+    connection leaves the journal mode to the writers and never takes the
+    write lock.
+    """
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{path}?mode=ro' if read_only else path,
+    }
+    if tuned:
+        pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        if read_only:
+            pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+        database['OPTIONS'] = {
+            'timeout': busy_timeout,
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+        }
+        if not read_only:
+            database['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    if read_only:
+        database['TEST'] = {'MIRROR': 'default'}
+    return database
+
+def postgres_database(name, user, password, host, port=5432, pool=True, pool_min_size=2, pool_max_size=20,
+                      pool_timeout=10, conn_max_age=600, sslmode=None):
+    """
+    A DATABASES entry for PostgreSQL through psycopg 3.
+
+    With ``pool`` connections come from a psycopg_pool pool of
+    ``pool_min_size`` to ``pool_max_size`` connections, each checked before
+    it is handed out; a request waits up to ``pool_timeout`` seconds for one.
+    Without it every thread keeps its connection for ``conn_max_age``
+    seconds and Django checks it before reuse. Django does not allow both.
+    """
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': user,
+        'PASSWORD': password,
+        'HOST': host,
+        'PORT': port,
+        'OPTIONS': {},
+    }
+    if sslmode:
+        database['OPTIONS']['sslmode'] = sslmode
+    if pool:
+        from psycopg_pool import ConnectionPool
+
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': pool_min_size,
+            'max_size': pool_max_size,
+            'timeout': pool_timeout,
+            'check': ConnectionPool.check_connection,
+        }
+    else:
+        database['CONN_MAX_AGE'] = conn_max_age
+        database['CONN_HEALTH_CHECKS'] = True
+    return database
@@ -15,6 +15,8 @@ import os
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from .databases import postgres_database, sqlite_database
+
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -62,6 +64,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.replicas.StickyWriteMiddleware",
 ]
 
 # Allow iframes to display content from the same origin
@@ -127,12 +130,85 @@ db_path = BASE_DIR / "db.sqlite3"
 # if os.getenv("SPACE_ID"):
 #     db_path = Path("/data/db.sqlite3")
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": db_path,
+# WAL, busy timeout and BEGIN IMMEDIATE for concurrent writers, see
+# pms_server/databases.py; set SQLITE_TUNING=false for SQLite's defaults
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "true").lower() == "true"
+
+# Seconds a connection waits for another writer before "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 20))
+
+# 'sqlite' (db_path above) or 'postgres' (POSTGRES_* variables below)
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "sqlite")
+
+if DATABASE_ENGINE == "postgres":
+    DATABASES = {
+        "default": postgres_database(
+            name=os.getenv("POSTGRES_DB", "pms"),
+            user=os.getenv("POSTGRES_USER", "pms"),
+            password=os.getenv("POSTGRES_PASSWORD", ""),
+            host=os.getenv("POSTGRES_HOST", "localhost"),
+            port=int(os.getenv("POSTGRES_PORT", 5432)),
+            # Pooled by default; POSTGRES_POOL=false keeps one persistent connection per thread instead
+            pool=os.getenv("POSTGRES_POOL", "true").lower() == "true",
+            pool_min_size=int(os.getenv("POSTGRES_POOL_MIN_SIZE", 2)),
+            pool_max_size=int(os.getenv("POSTGRES_POOL_MAX_SIZE", 20)),
+            pool_timeout=float(os.getenv("POSTGRES_POOL_TIMEOUT", 10)),
+            conn_max_age=int(os.getenv("POSTGRES_CONN_MAX_AGE", 600)),
+            sslmode=os.getenv("POSTGRES_SSLMODE"),
+        ),
+    }
+else:
+    DATABASES = {
+        "default": sqlite_database(db_path, tuned=SQLITE_TUNING, busy_timeout=SQLITE_BUSY_TIMEOUT),
+    }
+
+# Replica for the reads of GET views marked with api.replicas.replica_read:
+# a PostgreSQL standby at POSTGRES_REPLICA_HOST, or with SQLITE_READ_CONNECTION=true
+# a read-only connection to the SQLite file
+if DATABASE_ENGINE == "postgres" and os.getenv("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.getenv("POSTGRES_REPLICA_HOST"),
+        "PORT": int(os.getenv("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"])),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
     }
+elif DATABASE_ENGINE != "postgres" and os.getenv("SQLITE_READ_CONNECTION", "false").lower() == "true":
+    DATABASES["replica"] = sqlite_database(db_path, tuned=SQLITE_TUNING, busy_timeout=SQLITE_BUSY_TIMEOUT,
+                                           read_only=True)
+
+DATABASE_ROUTERS = ["api.replicas.ReplicaRouter"]
+
+# Seconds a PostgreSQL replica may lag before reads go back to the primary,
+# and how often that is checked
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 2))
+
+# Seconds a user's reads stay on the primary after their own write; keep it
+# above REPLICA_MAX_LAG so users always see their changes
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 10))
+
+# Shared by the workers for read-your-writes windows and user snapshots:
+# 'file' (a directory at CACHE_LOCATION, workers on one host), 'database'
+# (the table CACHE_LOCATION, create it with `manage.py createcachetable`),
+# 'redis' (a redis:// URL in CACHE_LOCATION, needs the redis package) or
+# 'locmem' (one process only; replica reads and user snapshots are then off)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "file")
+CACHE_BACKENDS = {
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", os.path.join(BASE_DIR, "run", "cache")),
+    "database": ("django.core.cache.backends.db.DatabaseCache", "pms_cache"),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://localhost:6379/0"),
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "pms"),
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.getenv("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+    },
 }
+if CACHE_BACKEND != "redis":
+    # Room for a snapshot and a write timestamp per active user; Redis evicts by its own maxmemory
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 20000))}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -174,12 +250,84 @@ STATIC_URL = "static/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Mount points media files are spread over; MEDIA_ROOT is always the first.
+# Extra volumes are absolute paths separated by os.pathsep
+MEDIA_VOLUMES = [MEDIA_ROOT] + [Path(volume) for volume in os.getenv("MEDIA_EXTRA_VOLUMES", "").split(os.pathsep) if volume]
+
+# Volume new files of a paperwork go to: 'hash' (by paperwork id) or 'free_space'
+MEDIA_PLACEMENT_POLICY = os.getenv("MEDIA_PLACEMENT_POLICY", "hash")
+
+# Who sends file bodies of the paperwork file views: 'python', 'x-accel'
+# (nginx), 'x-sendfile' (Apache/lighttpd) or 'asgi' (pms_server.asgi middleware)
+FILE_DELIVERY_MODE = os.getenv("FILE_DELIVERY_MODE", "python")
+
+# Internal nginx location for 'x-accel'; volume N is served from <prefix>/N/
+FILE_DELIVERY_ACCEL_PREFIX = os.getenv("FILE_DELIVERY_ACCEL_PREFIX", "/protected/")
+
 # File type specific storage paths
 PDF_STORAGE_PATH = 'pdf_files'
 LATEX_STORAGE_PATH = 'latex_files'
 PYTHON_STORAGE_PATH = 'python_files'
 DOCX_STORAGE_PATH = 'docx_files'
 
+# Content-addressed store shared by all version files
+BLOB_STORAGE_PATH = 'blobs'
+
+# Partially uploaded files of resumable upload sessions
+UPLOAD_STAGING_PATH = 'uploads'
+
+# Hours an upload session may stay open without receiving a chunk before
+# `manage.py expire_upload_sessions` aborts it and removes its staged files
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+
+# Persisted central-directory indexes of code ZIPs
+ZIP_INDEX_PATH = 'zipindex'
+
+# Largest ZIP member the raw member endpoint streams
+ZIP_MEMBER_MAX_BYTES = int(os.getenv("ZIP_MEMBER_MAX_BYTES", 200 * 1024 * 1024))
+
+# Largest text member returned inline by the JSON member endpoint; anything
+# bigger or binary is linked to the raw endpoint instead
+ZIP_MEMBER_JSON_MAX_BYTES = int(os.getenv("ZIP_MEMBER_JSON_MAX_BYTES", 1024 * 1024))
+
+# Versions kept per paperwork unless PaperWork.retention_count says otherwise
+VERSION_RETENTION_COUNT = 5
+
+# Prune old versions in a background thread after submissions; disable when
+# running `manage.py prune_versions` from cron instead
+VERSION_PRUNE_IN_PROCESS = True
+
+# Threads used to delete the files of pruned versions
+VERSION_PRUNE_WORKERS = 4
+
+# Serve dashboard stats from StatusCount rows kept up to date on every status
+# change instead of counting paperworks; run `manage.py rebuild_status_counts`
+# after turning it on
+PAPERWORK_STATUS_COUNTS = os.getenv("PAPERWORK_STATUS_COUNTS", "false").lower() == "true"
+
+# Notifications older than this are folded into per paper and month summaries
+# by `manage.py compact_notifications`
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))
+
+# How notifications reach the streams held by other ASGI workers: 'local'
+# (this process only, for a single worker), 'socket' (Unix datagram sockets
+# in NOTIFICATION_STREAM_SOCKET_DIR, workers on one host) or 'sqlite' (a
+# shared SQLite file polled every NOTIFICATION_STREAM_POLL_INTERVAL seconds)
+NOTIFICATION_STREAM_BROKER = os.getenv("NOTIFICATION_STREAM_BROKER", "local")
+NOTIFICATION_STREAM_SOCKET_DIR = os.getenv("NOTIFICATION_STREAM_SOCKET_DIR", os.path.join(BASE_DIR, "run", "notifications"))
+NOTIFICATION_STREAM_SQLITE_PATH = os.getenv("NOTIFICATION_STREAM_SQLITE_PATH", os.path.join(BASE_DIR, "run", "notifications.sqlite3"))
+NOTIFICATION_STREAM_POLL_INTERVAL = float(os.getenv("NOTIFICATION_STREAM_POLL_INTERVAL", 0.5))
+
+# Seconds between keepalive comments on an idle stream, below the proxy's read timeout
+NOTIFICATION_STREAM_HEARTBEAT = float(os.getenv("NOTIFICATION_STREAM_HEARTBEAT", 15))
+
+# Notifications buffered per stream; a client that falls further behind is told to resync
+NOTIFICATION_STREAM_QUEUE_SIZE = 100
+
+# Seconds a signed stream URL from /api/notifications/stream-url/ can be used
+# to open a stream; an open stream is not cut when it expires
+NOTIFICATION_STREAM_URL_TTL = int(os.getenv("NOTIFICATION_STREAM_URL_TTL", 60))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -188,7 +336,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication'
+        'auth_app.authentication.CachedJWTAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -197,6 +345,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Largest ``limit`` the keyset-paginated list endpoints accept
+PAGE_SIZE_MAX = 100
+
 # Custom user model
 AUTH_USER_MODEL = 'auth_app.User'
 
@@ -209,6 +360,14 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True
 }
 
+# Seconds signed file URLs stay the same; each is valid for one to two of these
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", 300))
+
+# Validated access tokens kept per process, and seconds a user's role,
+# status and active flag are served from the cache instead of the database
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_USER_CACHE_SECONDS = int(os.getenv("AUTH_USER_CACHE_SECONDS", 30))
+
 # Allowed headers for CORS requests
 CORS_ALLOW_HEADERS = [
     "accept",
@@ -234,6 +393,22 @@ CORS_ALLOW_METHODS = [
 
 FIREBASE_CREDENTIALS_FILE = os.environ.get("FIREBASE_CREDENTIALS_FILE")
 
+# Google's Firebase ID-token signing certificates, or "offline" for a key
+# generated at start-up (see auth_app.idtokens.offline_token)
+FIREBASE_KEYS_URL = os.getenv(
+    "FIREBASE_KEYS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+)
+# Project the ID tokens are issued for, by default the service key's
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
+# Seconds before the keys expire to fetch new ones in the background, the
+# least seconds between fetches for unknown key ids, and the fetch timeout
+FIREBASE_KEYS_REFRESH_AHEAD = 300
+FIREBASE_KEYS_MIN_FETCH_INTERVAL = 60
+FIREBASE_KEYS_TIMEOUT = 5
+# Clock skew tolerated on ID-token timestamps, in seconds
+FIREBASE_ID_TOKEN_LEEWAY = 5
+
 # Preflight request max age (in seconds)
 CORS_PREFLIGHT_MAX_AGE = 86400
 